@@ -0,0 +1,66 @@
+import re
+from typing import Any, Optional
+
+from typing_extensions import override
+
+from docling_core.transforms.serializer.base import BaseDocSerializer, SerializationResult
+from docling_core.transforms.serializer.common import create_ser_result
+from docling_core.transforms.serializer.markdown import MarkdownPictureSerializer
+from docling_core.types.doc.document import (
+    DoclingDocument,
+    PictureDescriptionData,
+    PictureItem,
+)
+
+
+class AnnotationPictureSerializer(MarkdownPictureSerializer):
+    """自定义图片序列化器，添加图片自定义属性和描述"""
+    def __init__(self, doc_alignment, doc_width, show_description):
+        super().__init__()
+        self.doc_alignment = doc_alignment
+        self.doc_width = doc_width
+        self.show_description = show_description
+
+    @override
+    def serialize(
+        self,
+        *,
+        item: PictureItem,
+        doc_serializer: BaseDocSerializer,
+        doc: DoclingDocument,
+        separator: Optional[str] = None,
+        **kwargs: Any,
+    ) -> SerializationResult:
+        text_parts: list[str] = []
+
+        # 1. 调用父类的 serialize 方法获取原始的 Markdown 图片标签
+        parent_res = super().serialize(
+            item=item,
+            doc_serializer=doc_serializer,
+            doc=doc,
+            **kwargs,
+        )
+        original_markdown_tag = parent_res.text
+        modified_markdown_tag = original_markdown_tag
+
+        # 2. 解析原始标签并替换为自定义格式
+        match = re.fullmatch(r"!\[(.*?)\]\((.*?)\)", original_markdown_tag)
+        
+        if match:
+            url = match.group(2)
+            new_alt_text_with_attrs = f"Image|{self.doc_alignment}|{self.doc_width}"
+            modified_markdown_tag = f"![{new_alt_text_with_attrs}]({url})"
+        
+        text_parts.append(modified_markdown_tag)
+
+        # 3. 追加其他注解
+        if self.show_description:
+            for annotation in item.annotations:
+                if isinstance(annotation, PictureDescriptionData):
+                    text_parts.append(f"> Picture Description: {annotation.text}")
+
+        # 4. 使用分隔符连接所有部分
+        text_res = (separator or "\n").join(text_parts)
+        
+        # 5. 创建并返回序列化结果
+        return create_ser_result(text=text_res, span_source=item)
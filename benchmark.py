@@ -0,0 +1,335 @@
+import argparse
+import http.server
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from stage_profiler import max_rss_mb
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_INPUT_DIRS = ("./test2", "./test3", "./test4")
+DEFAULT_OUTPUT = "./output/benchmark/results.json"
+DEFAULT_BASELINE = "./output/benchmark/baseline.json"
+
+# 基准配置矩阵：与 main_custom.py 中的四种组合对应，另外覆盖 RapidOCR、
+# 图片缩放比例、关闭表格结构识别和（使用桩 VLM 的）图片描述
+CONFIGS = {
+    "pypdfium": dict(backend="pypdfium", ocr=None),
+    "pypdfium-easyocr": dict(backend="pypdfium", ocr="easyocr"),
+    "docling-parse": dict(backend="docling_parse", ocr=None),
+    "docling-parse-easyocr": dict(backend="docling_parse", ocr="easyocr"),
+    "docling-parse-rapidocr": dict(backend="docling_parse", ocr="rapidocr"),
+    "docling-parse-no-tables": dict(backend="docling_parse", ocr=None, table_structure=False),
+    "docling-parse-scale2": dict(backend="docling_parse", ocr=None, images_scale=2.0),
+    "docling-parse-picture-description": dict(
+        backend="docling_parse", ocr=None, images_scale=2.0, picture_description=True
+    ),
+}
+
+
+def build_pipeline(config, vlm_url=None):
+    """根据基准配置构建 (PdfPipelineOptions, 后端类)"""
+    from docling.datamodel.pipeline_options import (
+        EasyOcrOptions,
+        PdfPipelineOptions,
+        PictureDescriptionApiOptions,
+        RapidOcrOptions,
+    )
+
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.images_scale = config.get("images_scale", 1.0)
+    pipeline_options.do_table_structure = config.get("table_structure", True)
+    pipeline_options.table_structure_options.do_cell_matching = True
+
+    ocr = config.get("ocr")
+    pipeline_options.do_ocr = ocr is not None
+    if ocr == "easyocr":
+        pipeline_options.ocr_options = EasyOcrOptions()
+    elif ocr == "rapidocr":
+        from model_resolver import resolve_rapidocr_models
+
+        det_model_path, rec_model_path, cls_model_path = resolve_rapidocr_models()
+        pipeline_options.ocr_options = RapidOcrOptions(
+            det_model_path=det_model_path,
+            rec_model_path=rec_model_path,
+            cls_model_path=cls_model_path,
+        )
+
+    if config.get("picture_description"):
+        if vlm_url is None:
+            raise ValueError("图片描述配置需要桩 VLM 服务地址")
+        pipeline_options.enable_remote_services = True
+        pipeline_options.generate_picture_images = True
+        pipeline_options.do_picture_description = True
+        pipeline_options.picture_description_options = PictureDescriptionApiOptions(
+            url=vlm_url,
+            params=dict(model="stub"),
+            prompt="Describe the image in three sentences. Be consise and accurate.",
+            timeout=30,
+        )
+
+    if config.get("backend") == "pypdfium":
+        from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend as backend
+    else:
+        from docling.backend.docling_parse_v4_backend import DoclingParseV4DocumentBackend as backend
+    return pipeline_options, backend
+
+
+class _StubVlmHandler(http.server.BaseHTTPRequestHandler):
+    """返回固定描述的 OpenAI 兼容接口，让图片描述的耗时只反映流水线本身"""
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        body = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "A stub description of the picture."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubVlmServer:
+    """本地桩 VLM 服务，latency 为每次请求的模拟耗时（秒）"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.httpd = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+
+    def start(self):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StubVlmHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = self.latency
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+def run_config(name, documents, vlm_url=None, repeat=1):
+    """在当前进程中运行一个配置，返回该配置的测量结果
+
+    转换器初始化（加载模型）单独计时，不计入文档耗时；每个文档转换 repeat 次取中位数。
+    """
+    from converter_registry import get_converter
+
+    start = time.perf_counter()
+    pipeline_options, backend = build_pipeline(CONFIGS[name], vlm_url)
+    converter = get_converter(pipeline_options, backend=backend)
+    init_seconds = time.perf_counter() - start
+
+    results = []
+    for path in documents:
+        timings = []
+        pages = 0
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conv_res = converter.convert(path)
+                timings.append(time.perf_counter() - start)
+                pages = len(conv_res.document.pages)
+            results.append(dict(path=str(path), pages=pages, seconds=statistics.median(timings),
+                                status=conv_res.status.value))
+        except Exception as e:
+            _log.error(f"[{name}] 转换 {path} 失败: {e}")
+            results.append(dict(path=str(path), pages=0, seconds=None, status="error", error=str(e)))
+
+    converted = [r for r in results if r["seconds"] is not None]
+    total_pages = sum(r["pages"] for r in converted)
+    total_seconds = sum(r["seconds"] for r in converted)
+    return dict(
+        config=CONFIGS[name],
+        init_seconds=init_seconds,
+        documents=results,
+        total_pages=total_pages,
+        total_seconds=total_seconds,
+        pages_per_sec=total_pages / total_seconds if total_seconds else None,
+        peak_rss_mb=max_rss_mb(),
+    )
+
+
+def run_config_subprocess(name, documents, vlm_url=None, repeat=1, timeout=None):
+    """在独立子进程中运行一个配置，保证峰值内存和模型加载互不影响"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = Path(tmp_dir) / "result.json"
+        cmd = [sys.executable, __file__, "--run-config", name, "--result-file", str(result_path),
+               "--repeat", str(repeat)]
+        if vlm_url:
+            cmd += ["--vlm-url", vlm_url]
+        cmd += [str(p) for p in documents]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return dict(config=CONFIGS[name], error=f"超时（{timeout} 秒）")
+        if proc.returncode != 0 or not result_path.exists():
+            return dict(config=CONFIGS[name], error=proc.stderr[-2000:])
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def collect_documents(input_dirs):
+    documents = []
+    for input_dir in input_dirs:
+        documents.extend(sorted(Path(input_dir).glob("*.pdf")))
+    return documents
+
+
+def compare(results, baseline, tolerance=0.15):
+    """与基线比较，返回回归描述列表
+
+    pages/sec 下降、单文档耗时或峰值内存上升超过 tolerance（比例）即视为回归。
+    """
+    regressions = []
+    for name, current in results["configs"].items():
+        base = baseline.get("configs", {}).get(name)
+        if base is None or "error" in base:
+            continue
+        if "error" in current:
+            regressions.append(f"{name}: 运行失败（基线中成功）")
+            continue
+
+        if base.get("pages_per_sec") and current.get("pages_per_sec") is not None:
+            if current["pages_per_sec"] < base["pages_per_sec"] * (1 - tolerance):
+                regressions.append(
+                    f"{name}: pages/sec {base['pages_per_sec']:.2f} -> {current['pages_per_sec']:.2f}"
+                )
+        if base.get("peak_rss_mb") and current.get("peak_rss_mb") is not None \
+                and current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: 峰值内存 {base['peak_rss_mb']:.0f} MB -> {current['peak_rss_mb']:.0f} MB"
+            )
+
+        base_docs = {d["path"]: d for d in base["documents"]}
+        for doc in current["documents"]:
+            base_doc = base_docs.get(doc["path"])
+            if not base_doc or base_doc["seconds"] is None:
+                continue
+            if doc["seconds"] is None:
+                regressions.append(f"{name}: {doc['path']} 转换失败（基线中成功）")
+            elif doc["seconds"] > base_doc["seconds"] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {doc['path']} {base_doc['seconds']:.2f}s -> {doc['seconds']:.2f}s"
+                )
+    return regressions
+
+
+def print_summary(results):
+    print(f"{'配置':<36} {'页数':>6} {'耗时(秒)':>10} {'页/秒':>8} {'初始化(秒)':>10} {'峰值内存(MB)':>12}")
+    for name, r in results["configs"].items():
+        if "error" in r:
+            print(f"{name:<36} 失败: {r['error'].strip().splitlines()[-1] if r['error'].strip() else ''}")
+            continue
+        pages_per_sec = f"{r['pages_per_sec']:.2f}" if r["pages_per_sec"] is not None else "-"
+        print(f"{name:<36} {r['total_pages']:>6} {r['total_seconds']:>10.2f} {pages_per_sec:>8} "
+              f"{r['init_seconds']:>10.2f} {r['peak_rss_mb'] or 0:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在测试 PDF 上运行流水线配置矩阵的基准测试")
+    parser.add_argument("documents", nargs="*", help="要转换的 PDF，默认使用 test2/test3/test4 下的全部文件")
+    parser.add_argument("--configs", nargs="+", choices=sorted(CONFIGS), default=list(CONFIGS),
+                        help="要运行的配置，默认运行全部")
+    parser.add_argument("--repeat", type=int, default=1, help="每个文档重复转换的次数，取中位数")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线 JSON 路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为新的基线")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="判定回归的相对变化阈值")
+    parser.add_argument("--vlm-latency", type=float, default=0.0, help="桩 VLM 每次请求的模拟耗时（秒）")
+    parser.add_argument("--timeout", type=float, default=None, help="单个配置的超时时间（秒）")
+    # 以下参数供子进程内部使用
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    parser.add_argument("--vlm-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.run_config:
+        result = run_config(args.run_config, [Path(p) for p in args.documents], args.vlm_url, args.repeat)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    documents = [Path(p) for p in args.documents] or collect_documents(DEFAULT_INPUT_DIRS)
+    if not documents:
+        logging.error("没有找到要测试的 PDF 文件")
+        sys.exit(2)
+
+    stub_vlm = None
+    if any(CONFIGS[name].get("picture_description") for name in args.configs):
+        stub_vlm = StubVlmServer(latency=args.vlm_latency)
+        stub_vlm.start()
+
+    results = dict(
+        meta=dict(
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            processor=platform.processor(),
+            repeat=args.repeat,
+        ),
+        configs={},
+    )
+    try:
+        for name in args.configs:
+            logging.info(f"运行配置 {name}（{len(documents)} 个文档）")
+            results["configs"][name] = run_config_subprocess(
+                name, documents, stub_vlm.url if stub_vlm else None, args.repeat, args.timeout
+            )
+    finally:
+        if stub_vlm:
+            stub_vlm.stop()
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print_summary(results)
+    print(f"\n结果已保存到: {output_path}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"已保存为基线: {baseline_path}")
+    elif baseline_path.exists():
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回归（阈值 {args.tolerance:.0%}）:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\n与基线相比没有性能回归")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+_log = logging.getLogger(__name__)
+
+
+def file_hash(path, chunk_size: int = 1 << 20) -> str:
+    """分块计算文件内容的 sha256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ConversionManifest:
+    """输出目录中的转换清单，记录哪些输入已按哪种配置转换过
+
+    条目以 "<PDF 内容哈希>:<配置哈希>" 为键，配置变化只会使对应配置的条目失效。
+    内容相同的多个文件共用一个条目，条目中按输出路径分别记录各自的源文件。
+    文件的内容哈希按 (大小, 修改时间) 缓存，未变化的文件无需重新读取。
+    """
+    FILE_NAME = ".conversion_manifest.json"
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / self.FILE_NAME
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.file_hashes = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.entries = data.get("entries", {})
+                self.file_hashes = data.get("file_hashes", {})
+            except (OSError, ValueError) as e:
+                _log.warning(f"读取转换清单失败，将重新转换全部文件: {e}")
+
+    def content_hash(self, pdf_path) -> str:
+        """返回文件内容哈希，文件大小和修改时间未变时直接使用缓存值"""
+        pdf_path = Path(pdf_path)
+        st = pdf_path.stat()
+        cache_key = str(pdf_path.resolve())
+        with self._lock:
+            cached = self.file_hashes.get(cache_key)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["sha256"]
+
+        digest = file_hash(pdf_path)
+        with self._lock:
+            self.file_hashes[cache_key] = dict(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=digest)
+        return digest
+
+    @staticmethod
+    def _key(content_hash, options_key):
+        return f"{content_hash}:{options_key}"
+
+    def is_current(self, content_hash, options_key, output_file) -> bool:
+        """该输入是否已按相同配置转换到 output_file 且结果仍然存在"""
+        with self._lock:
+            entry = self.entries.get(self._key(content_hash, options_key))
+        return (
+            entry is not None
+            and str(output_file) in entry.get("outputs", {})
+            and Path(output_file).exists()
+        )
+
+    def record(self, pdf_path, content_hash, options_key, output_file):
+        """记录一次成功的转换"""
+        with self._lock:
+            entry = self.entries.setdefault(self._key(content_hash, options_key), dict(outputs={}))
+            entry.setdefault("outputs", {})[str(output_file)] = Path(pdf_path).name
+
+    def save(self):
+        """原子地写回清单文件"""
+        with self._lock:
+            data = json.dumps(
+                dict(entries=self.entries, file_hashes=self.file_hashes),
+                ensure_ascii=False, indent=2,
+            )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
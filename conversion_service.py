@@ -0,0 +1,429 @@
+import http.server
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from main_custom_oss_serializer import ConfigManager, DocumentProcessor
+
+_log = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+RESULT_FORMATS = ("markdown", "json")
+
+
+class ConversionJob:
+    """一次文档转换任务"""
+    def __init__(self, client, source, result_format="markdown", name=None, cleanup=False):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.source = source
+        self.name = name or Path(source).name
+        self.result_format = result_format
+        self.cleanup = cleanup  # 上传的临时文件在转换后删除
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        info = dict(
+            job_id=self.id,
+            client=self.client,
+            name=self.name,
+            format=self.result_format,
+            status=self.status,
+            submitted_at=self.submitted_at,
+        )
+        if self.started_at is not None:
+            info["queue_seconds"] = self.started_at - self.submitted_at
+        if self.finished_at is not None:
+            info["convert_seconds"] = self.finished_at - self.started_at
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class FairJobQueue:
+    """按客户端轮转的任务队列
+
+    每个客户端有自己的先进先出队列，取任务时在有任务的客户端之间轮流，
+    一个客户端一次提交大量文档不会让其他客户端一直等待。
+    """
+    def __init__(self):
+        self._queues = OrderedDict()  # 客户端 -> deque，顺序即轮转顺序
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, job):
+        with self._cond:
+            self._queues.setdefault(job.client, deque()).append(job)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """取出下一个任务，队列关闭或超时时返回 None"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queues or self._closed, timeout):
+                return None
+            if not self._queues:
+                return None
+            client, jobs = next(iter(self._queues.items()))
+            job = jobs.popleft()
+            del self._queues[client]
+            if jobs:
+                self._queues[client] = jobs  # 还有任务的客户端排到队尾
+            return job
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {client: len(jobs) for client, jobs in self._queues.items()}
+
+
+class _ServiceHandler(http.server.BaseHTTPRequestHandler):
+    """转换服务的 HTTP 接口
+
+    POST /v1/jobs           提交任务：JSON {"path": ...} 或直接上传 PDF（Content-Type: application/pdf）
+                            查询参数 format=markdown|json，wait=1 时等待转换完成并直接返回结果
+    GET  /v1/jobs/<id>        查询任务状态
+    GET  /v1/jobs/<id>/result 获取转换结果
+    GET  /healthz, /metrics
+    """
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_result(self, job):
+        if job.status == FAILED:
+            self._send_json(500, job.to_dict())
+        elif job.status != DONE:
+            self._send_json(202, job.to_dict())
+        elif job.result_format == "json":
+            self._send_json(200, job.result)
+        else:
+            body = job.result.encode("utf-8")
+            self.send_response(200)
+            self.send_header('Content-type', 'text/markdown; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-Job-Id', job.id)
+            self.end_headers()
+            self.wfile.write(body)
+
+    def _client_id(self):
+        return self.headers.get('X-Client-Id') or self.client_address[0]
+
+    def do_GET(self):
+        service = self.server.service
+        path = urllib.parse.urlparse(self.path).path
+        if path == '/healthz':
+            if service.is_ready.is_set():
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(503, {"status": "loading"})
+        elif path == '/metrics':
+            self._send_json(200, service.snapshot())
+        elif path.startswith('/v1/jobs/'):
+            parts = path[len('/v1/jobs/'):].split('/')
+            job = service.get_job(parts[0])
+            if job is None:
+                self._send_json(404, {"error": "任务不存在"})
+            elif len(parts) == 1:
+                self._send_json(200, job.to_dict())
+            elif parts[1:] == ['result']:
+                self._send_result(job)
+            else:
+                self._send_json(404, {"error": "未知路径"})
+        else:
+            self._send_json(404, {"error": "未知路径"})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/v1/jobs':
+            self._send_json(404, {"error": "未知路径"})
+            return
+
+        query = urllib.parse.parse_qs(url.query)
+        result_format = query.get('format', ['markdown'])[0]
+        wait = query.get('wait', ['0'])[0] in ('1', 'true')
+        if result_format not in RESULT_FORMATS:
+            self._send_json(400, {"error": f"不支持的结果格式: {result_format}"})
+            return
+
+        content_length = int(self.headers.get('Content-Length', 0))
+        content_type = self.headers.get('Content-Type', '')
+        try:
+            if content_type.startswith('application/json'):
+                request_data = json.loads(self.rfile.read(content_length))
+                result_format = request_data.get('format', result_format)
+                wait = request_data.get('wait', wait)
+                job = service.submit_path(request_data['path'], self._client_id(), result_format)
+            else:
+                name = query.get('name', ['upload.pdf'])[0]
+                job = service.submit_upload(self.rfile, content_length, self._client_id(),
+                                            result_format, name)
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": f"请求无效: {e}"})
+            return
+        except PermissionError as e:
+            self._send_json(403, {"error": str(e)})
+            return
+        except FileNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+            return
+
+        if wait:
+            job.done.wait()
+            self._send_result(job)
+        else:
+            self._send_json(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        _log.debug(format % args)
+
+
+class ConversionService:
+    """常驻的文档转换服务
+
+    模型、转换器和 OSS 连接池只创建一次并常驻内存，之后每个文档的耗时
+    只包括转换本身。docling 的流水线不是线程安全的，转换在单个工作线程中
+    依次执行；HTTP 请求由多线程服务器接收，任务按客户端公平排队。
+    服务没有身份验证，默认只监听 127.0.0.1；host 设为 "0.0.0.0" 等地址时才对外开放。
+    按路径提交只允许 input_root 目录下的文件，input_root 为 None 时只接受上传。
+    """
+    def __init__(self, port=5000, doc_alignment="Left", doc_width="700", show_description=False,
+                 image_encoding=None, upload_dir="./output/.service_uploads",
+                 max_finished_jobs=1000, warm_up=True, host="127.0.0.1", input_root=None):
+        self.host = host
+        self.port = port
+        self.input_root = Path(input_root).resolve() if input_root is not None else None
+        self.doc_alignment = doc_alignment
+        self.doc_width = doc_width
+        self.show_description = show_description
+        self.image_encoding = image_encoding
+        self.upload_dir = Path(upload_dir)
+        self.max_finished_jobs = max_finished_jobs
+        self.warm_up = warm_up
+        self.queue = FairJobQueue()
+        self.jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        # 所有任务共用一个处理器，OSS 上传器及其连接池只创建一次
+        self.processor = DocumentProcessor(self._config(None), image_encoding=image_encoding)
+        self.is_ready = threading.Event()
+        self.httpd = None
+        self.worker_thread = None
+        self.server_thread = None
+        self.completed = 0
+        self.failed = 0
+
+    def _config(self, source):
+        return ConfigManager(source, None, self.doc_alignment, self.doc_width, self.show_description)
+
+    def _add_job(self, job):
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        _log.info(f"已提交任务 {job.id[:8]}: {job.name}（客户端 {job.client}）")
+        return job
+
+    def submit_path(self, path, client, result_format="markdown"):
+        """提交服务器本地的 PDF 文件，path 为相对 input_root 的路径"""
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(f"不支持的结果格式: {result_format}")
+        if self.input_root is None:
+            raise PermissionError("服务未配置 input_root，不接受按路径提交")
+        # 解析符号链接和 ".." 后必须仍在 input_root 之内
+        path = (self.input_root / path).resolve()
+        if not path.is_relative_to(self.input_root):
+            raise PermissionError(f"路径不在允许的输入目录内: {path}")
+        if not path.is_file():
+            raise FileNotFoundError(f"文件不存在: {path}")
+        return self._add_job(ConversionJob(client, str(path), result_format))
+
+    def submit_upload(self, stream, length, client, result_format="markdown", name="upload.pdf"):
+        """保存上传的 PDF 到临时文件并提交"""
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf", dir=self.upload_dir)
+        with os.fdopen(fd, "wb") as f:
+            remaining = length
+            while remaining > 0:
+                chunk = stream.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        return self._add_job(ConversionJob(client, tmp_path, result_format, name=name, cleanup=True))
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def _forget_finished(self):
+        """只保留最近的 max_finished_jobs 个已完成任务的结果"""
+        with self._jobs_lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self.jobs[job_id]
+
+    def _run_job(self, job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            # 只有工作线程会修改 processor，无需加锁
+            processor = self.processor
+            processor.config = self._config(job.source)
+            doc = processor.convert_document()
+            doc = processor.process_images(doc)
+            if job.result_format == "json":
+                from page_image_store import embed_page_images
+
+                # 页面图片在落盘缓存中，结果里需要内嵌的 PNG
+                embed_page_images(doc)
+                job.result = doc.export_to_dict()
+            else:
+                job.result = processor.serialize_document(doc).text
+            job.status = DONE
+            self.completed += 1
+        except Exception as e:
+            _log.error(f"任务 {job.id[:8]} 转换失败: {e}")
+            job.error = str(e)
+            job.status = FAILED
+            self.failed += 1
+        finally:
+            # 无论成功与否都删除本次转换的页面图片缓存，embed_page_images 之后同样需要
+            self.processor.release_page_images()
+            job.finished_at = time.time()
+            if job.cleanup:
+                try:
+                    os.remove(job.source)
+                except OSError:
+                    pass
+            job.done.set()
+        _log.info(f"任务 {job.id[:8]} {job.status}，耗时 {job.finished_at - job.started_at:.2f} 秒")
+
+    def _worker(self):
+        if self.warm_up:
+            # 提前初始化转换器，加载布局/表格/OCR 模型
+            from converter_registry import get_converter
+
+            start = time.perf_counter()
+            try:
+                get_converter(self.processor.setup_pipeline_options(),
+                              pipeline_cls=self.processor.pipeline_class())
+                _log.info(f"模型加载完成，耗时 {time.perf_counter() - start:.2f} 秒")
+            except Exception as e:
+                _log.error(f"预加载模型失败，将在第一个任务时重试: {e}")
+        self.is_ready.set()
+
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            self._run_job(job)
+            self._forget_finished()
+
+    def snapshot(self):
+        """返回服务状态，用于 /metrics"""
+        with self._jobs_lock:
+            running = [job.id for job in self.jobs.values() if job.status == RUNNING]
+        return {
+            "ready": self.is_ready.is_set(),
+            "queued": self.queue.snapshot(),
+            "running": running,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def start(self):
+        """启动转换服务，模型在后台加载，加载完成前 /healthz 返回 503"""
+        httpd = http.server.ThreadingHTTPServer((self.host, self.port), _ServiceHandler)
+        httpd.daemon_threads = True
+        httpd.service = self
+        self.httpd = httpd
+        self.port = httpd.server_address[1]
+
+        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
+        self.worker_thread.start()
+        self.server_thread = threading.Thread(
+            target=httpd.serve_forever, kwargs=dict(poll_interval=0.5), daemon=True
+        )
+        self.server_thread.start()
+        _log.info(f"转换服务已启动: http://{self.host}:{self.port}")
+        if self.host not in ("127.0.0.1", "localhost", "::1"):
+            _log.warning("转换服务监听在非本机地址上且没有身份验证，请确认网络环境可信")
+
+    def wait_ready(self, timeout=None):
+        """等待模型加载完成"""
+        return self.is_ready.wait(timeout)
+
+    def stop(self):
+        """停止接收请求，等待当前任务完成后退出"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        self.queue.close()
+        if self.worker_thread:
+            self.worker_thread.join()
+            self.worker_thread = None
+
+
+def submit(path, port=5000, result_format="markdown", timeout=3600):
+    """向本地转换服务提交 PDF 并等待结果，返回 Markdown 文本或 JSON 字典"""
+    with open(path, "rb") as f:
+        data = f.read()
+    query = urllib.parse.urlencode(dict(format=result_format, wait=1, name=Path(path).name))
+    request = urllib.request.Request(
+        f"http://localhost:{port}/v1/jobs?{query}",
+        data=data,
+        headers={'Content-Type': 'application/pdf'},
+        method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as resp:
+        body = resp.read().decode("utf-8")
+    return json.loads(body) if result_format == "json" else body
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    # 只在本机监听；按路径提交只能访问 test3 目录下的文件
+    service = ConversionService(port=5000, input_root="./test3")
+    service.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logging.info("正在停止转换服务...")
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
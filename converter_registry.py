@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+_log = logging.getLogger(__name__)
+
+
+def _qualified_name(cls):
+    """返回类的完整名称，None 时返回空字符串"""
+    if cls is None:
+        return ""
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def options_hash(pipeline_options, pipeline_cls=None, backend=None):
+    """计算流水线配置的哈希值
+
+    serialize_as_any=True 保证子类字段（如 RapidOcrOptions 的模型路径、
+    ApiVlmOptions 的 url/params）也参与哈希，加速器配置作为
+    pipeline_options 的字段一并包含在内。
+    """
+    payload = "|".join([
+        _qualified_name(type(pipeline_options)),
+        pipeline_options.model_dump_json(serialize_as_any=True),
+        _qualified_name(pipeline_cls),
+        _qualified_name(backend),
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ConverterRegistry:
+    """DocumentConverter 注册表，按配置哈希复用已初始化的转换器
+
+    转换器创建后立即初始化流水线（加载布局/表格/OCR 模型），之后相同配置
+    直接返回缓存实例；超过 max_size 时淘汰最久未使用的配置。
+    注意：docling 的流水线不是线程安全的，同一个转换器不要在多个线程中并发调用。
+    """
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._converters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_converter(self, pipeline_options, pipeline_cls=None, backend=None,
+                      input_format=None):
+        """获取（必要时创建）与配置对应的已初始化转换器，input_format 默认为 PDF"""
+        # docling 导入较慢，只在真正需要转换器时才导入
+        from docling.datamodel.base_models import InputFormat
+        from docling.document_converter import DocumentConverter, PdfFormatOption
+
+        if input_format is None:
+            input_format = InputFormat.PDF
+        key = options_hash(pipeline_options, pipeline_cls, backend)
+
+        with self._lock:
+            converter = self._converters.get(key)
+            if converter is not None:
+                self._converters.move_to_end(key)
+                _log.debug(f"复用已初始化的转换器: {key[:12]}")
+                return converter
+
+            # 只传入显式指定的字段，其余使用 PdfFormatOption 的默认值
+            format_kwargs = dict(pipeline_options=pipeline_options)
+            if pipeline_cls is not None:
+                format_kwargs["pipeline_cls"] = pipeline_cls
+            if backend is not None:
+                format_kwargs["backend"] = backend
+
+            converter = DocumentConverter(
+                format_options={input_format: PdfFormatOption(**format_kwargs)}
+            )
+            converter.initialize_pipeline(input_format)
+            _log.info(f"已初始化新的转换器: {key[:12]}")
+
+            self._converters[key] = converter
+            while len(self._converters) > self.max_size:
+                evicted_key, _ = self._converters.popitem(last=False)
+                _log.info(f"淘汰最久未使用的转换器: {evicted_key[:12]}")
+
+            return converter
+
+    def clear(self):
+        """清空所有缓存的转换器"""
+        with self._lock:
+            self._converters.clear()
+
+    def __len__(self):
+        return len(self._converters)
+
+
+# 进程级默认注册表
+registry = ConverterRegistry()
+
+
+def get_converter(pipeline_options, pipeline_cls=None, backend=None,
+                  input_format=None):
+    """从默认注册表获取转换器"""
+    return registry.get_converter(pipeline_options, pipeline_cls, backend, input_format)
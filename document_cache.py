@@ -0,0 +1,218 @@
+import base64
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import threading
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+from conversion_manifest import file_hash
+from response_cache import digest
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:  # 未安装时退回 JSON + zlib
+    msgpack = zstandard = None
+
+_log = logging.getLogger(__name__)
+
+# 缓存条目格式的版本，格式变化时递增，旧条目自然失效
+FORMAT_VERSION = 1
+
+
+def _package_version(name):
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return ""
+
+
+def _encode(payload):
+    """编码缓存内容，返回 (文件扩展名, 字节)"""
+    if msgpack is not None:
+        data = msgpack.packb(payload, use_bin_type=True)
+        return "msgpack.zst", zstandard.ZstdCompressor(level=3).compress(data)
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return "json.z", zlib.compress(data, 6)
+
+
+def _decode(path):
+    """按扩展名解码缓存内容，当前环境无法解码时返回 None"""
+    data = path.read_bytes()
+    if path.name.endswith(".msgpack.zst"):
+        if msgpack is None:
+            return None
+        return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(data), raw=False)
+    return json.loads(zlib.decompress(data))
+
+
+def _image_refs(doc):
+    """遍历文档中的图片引用，生成 (标识, ImageRef)，标识在 export_to_dict 的结果中可定位"""
+    for key in ("pictures", "tables"):
+        for index, item in enumerate(getattr(doc, key)):
+            if item.image is not None:
+                yield f"{key}/{index}", item.image
+    for page_no, page in doc.pages.items():
+        if page.image is not None:
+            yield f"pages/{page_no}", page.image
+
+
+def _image_bytes(ref):
+    """取出图片的编码字节，返回 (扩展名, MIME 类型, 字节)；无法取得时返回 None
+
+    data URI 直接解码，不经过 PIL；其它来源（如落盘缓存中的页面图片）编码为 PNG。
+    """
+    uri = str(ref.uri)
+    if uri.startswith("data:"):
+        extension = mimetypes.guess_extension(ref.mimetype) or ".png"
+        return extension, ref.mimetype, base64.b64decode(uri.split(",", 1)[1])
+    image = ref.pil_image
+    if image is None:
+        return None
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return ".png", "image/png", buffer.getvalue()
+
+
+class DocumentCache:
+    """转换结果（DoclingDocument）的磁盘缓存
+
+    键由源文件内容哈希、流水线配置哈希和 docling 版本决定，只改序列化参数
+    （对齐方式、宽度、是否显示描述等）时直接复用已转换的文档，不再重新 OCR 和调用 VLM。
+    每个条目是 <cache_dir>/<key[:2]>/<key>/ 目录：文档结构保存为 msgpack + zstd
+    （未安装 msgpack/zstandard 时为 JSON + zlib），图片以原始编码单独存为文件，
+    载入后 ImageRef 直接指向这些文件，用到时才解码。
+    超过 max_bytes 时按最近访问时间淘汰整个条目。
+    """
+    def __init__(self, cache_dir, max_bytes: int = 4 << 30):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+        self._versions = (_package_version("docling"), _package_version("docling-core"))
+
+    def key(self, source, pipeline_options, pipeline_cls=None, backend=None):
+        """计算缓存键；source 不是本地文件（如 URL）时返回 None，表示不缓存"""
+        from converter_registry import options_hash
+
+        if not Path(source).is_file():
+            return None
+        return digest(dict(
+            format=FORMAT_VERSION,
+            source=file_hash(source),
+            options=options_hash(pipeline_options, pipeline_cls, backend),
+            versions=self._versions,
+        ))
+
+    def _entry_dir(self, key):
+        return self.cache_dir / key[:2] / key
+
+    @staticmethod
+    def _document_file(entry_dir):
+        for path in entry_dir.glob("document.*"):
+            return path
+        return None
+
+    def _entries(self):
+        """生成 (最近访问时间, 大小, 条目目录)"""
+        for entry_dir in self.cache_dir.glob("*/*"):
+            if entry_dir.suffix == ".tmp":
+                continue  # 正在写入的条目
+            document_file = self._document_file(entry_dir) if entry_dir.is_dir() else None
+            if document_file is None:
+                continue
+            try:
+                mtime = document_file.stat().st_mtime
+                size = sum(p.stat().st_size for p in entry_dir.rglob("*") if p.is_file())
+            except FileNotFoundError:
+                continue
+            yield mtime, size, entry_dir
+
+    def get(self, key):
+        """载入缓存的文档，未命中或条目损坏时返回 None"""
+        from docling_core.types.doc import DoclingDocument
+
+        entry_dir = self._entry_dir(key)
+        document_file = self._document_file(entry_dir)
+        if document_file is None:
+            return None
+        try:
+            payload = _decode(document_file)
+            if payload is None:
+                _log.info(f"缓存条目 {key[:12]} 的格式在当前环境中无法读取，将重新转换")
+                return None
+            doc = DoclingDocument.model_validate(payload["document"])
+            images = payload["images"]
+            for ref_id, ref in _image_refs(doc):
+                if ref_id in images:
+                    ref.uri = entry_dir / "images" / images[ref_id]
+            os.utime(document_file)  # 记录最近访问时间，供 LRU 淘汰使用
+            return doc
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _log.warning(f"读取缓存条目 {key[:12]} 失败: {e}")
+            return None
+
+    def put(self, key, doc):
+        """保存文档，图片单独写入文件；必要时淘汰旧条目"""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir.with_name(f"{entry_dir.name}.{threading.get_ident()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        (tmp_dir / "images").mkdir(parents=True)
+
+        try:
+            images = {}
+            image_types = {}
+            size = 0
+            for index, (ref_id, ref) in enumerate(_image_refs(doc)):
+                encoded = _image_bytes(ref)
+                if encoded is None:
+                    continue  # 例如 http 地址，保留原始 URI
+                extension, image_types[ref_id], data = encoded
+                images[ref_id] = f"{index}{extension}"
+                (tmp_dir / "images" / images[ref_id]).write_bytes(data)
+                size += len(data)
+
+            document = doc.export_to_dict()
+            # 图片已单独保存，文档中只留文件名，避免把 base64 再压缩一遍
+            for ref_id, file_name in images.items():
+                collection, index = ref_id.split("/")
+                container = document[collection][str(index) if collection == "pages" else int(index)]
+                container["image"]["uri"] = file_name
+                container["image"]["mimetype"] = image_types[ref_id]  # 例如落盘缓存的页面图片已转为 PNG
+
+            extension, data = _encode(dict(document=document, images=images))
+            (tmp_dir / f"document.{extension}").write_bytes(data)
+            size += len(data)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        with self._lock:
+            if entry_dir.exists():
+                self._total_bytes -= sum(p.stat().st_size for p in entry_dir.rglob("*") if p.is_file())
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        _log.info(f"已缓存转换结果 {key[:12]}（{size} 字节，{len(images)} 张图片）")
+
+    def _evict(self):
+        """按最近访问时间从旧到新删除条目，直到总大小不超过上限（调用方持有锁）"""
+        entries = sorted(self._entries(), key=lambda entry: entry[0])
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            self._total_bytes -= size
+        _log.info(f"转换缓存淘汰完成，当前大小: {self._total_bytes} 字节")
@@ -0,0 +1,510 @@
+import http.server
+import json
+import logging
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from response_cache import DiskCache, digest
+from upstream_scheduler import UpstreamScheduler
+
+DEFAULT_MODEL = "gemini-2.5-pro-preview-05-06"
+
+# 延迟直方图的桶上界（秒），最后一个桶收集超过 300 秒的请求
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+_log = logging.getLogger(__name__)
+
+
+class _ModelStats:
+    """单个模型的统计数据"""
+    def __init__(self, max_samples: int):
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.upstream_errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.latencies = deque(maxlen=max_samples)  # 最近的延迟样本，用于计算分位数
+        self.ttft = deque(maxlen=max_samples)  # 流式请求的首 token 延迟
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    @staticmethod
+    def _percentile(samples, q):
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q * len(samples))) - 1))
+        return samples[index]
+
+    def to_dict(self):
+        samples = sorted(self.latencies)
+        ttft_samples = sorted(self.ttft)
+        bucket_labels = [f"le_{b}" for b in LATENCY_BUCKETS] + ["le_inf"]
+        # 与 Prometheus 一致，直方图按上界累计计数
+        cumulative = []
+        running = 0
+        for count in self.buckets:
+            running += count
+            cumulative.append(running)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "upstream_errors": self.upstream_errors,
+            "latency_seconds": {
+                "p50": self._percentile(samples, 0.50),
+                "p95": self._percentile(samples, 0.95),
+                "p99": self._percentile(samples, 0.99),
+                "histogram": dict(zip(bucket_labels, cumulative)),
+            },
+            "ttft_seconds": {
+                "streamed": len(ttft_samples),
+                "p50": self._percentile(ttft_samples, 0.50),
+                "p95": self._percentile(ttft_samples, 0.95),
+            },
+            "usage": {
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.total_tokens,
+            },
+        }
+
+
+class ProxyMetrics:
+    """代理的运行指标：按模型统计请求数、延迟分布、错误数和 token 用量"""
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.started_at = time.time()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.upstream_in_flight = 0
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, model):
+        stats = self._models.get(model)
+        if stats is None:
+            stats = self._models[model] = _ModelStats(self.max_samples)
+        return stats
+
+    def record_request(self, model, latency, error=False):
+        """记录一次完整请求（含缓存命中）的延迟"""
+        with self._lock:
+            stats = self._stats(model)
+            stats.requests += 1
+            if error:
+                stats.errors += 1
+            stats.latencies.append(latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.buckets[i] += 1
+                    break
+            else:
+                stats.buckets[-1] += 1
+
+    def record_ttft(self, model, ttft):
+        """记录流式请求从收到请求到首个内容块的时间"""
+        with self._lock:
+            self._stats(model).ttft.append(ttft)
+
+    def record_cache_hit(self, model):
+        with self._lock:
+            self._stats(model).cache_hits += 1
+
+    def record_upstream_error(self, model):
+        with self._lock:
+            self._stats(model).upstream_errors += 1
+
+    def record_usage(self, model, usage):
+        """累加上游响应 usage 中的 token 数"""
+        if not usage:
+            return
+        with self._lock:
+            stats = self._stats(model)
+            stats.prompt_tokens += usage.get("prompt_tokens") or 0
+            stats.completion_tokens += usage.get("completion_tokens") or 0
+            stats.total_tokens += usage.get("total_tokens") or 0
+
+    def add_bytes(self, bytes_in=0, bytes_out=0):
+        with self._lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def upstream_started(self):
+        with self._lock:
+            self.upstream_in_flight += 1
+
+    def upstream_finished(self):
+        with self._lock:
+            self.upstream_in_flight -= 1
+
+    def snapshot(self):
+        """返回可 JSON 序列化的指标快照"""
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started_at,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "upstream_in_flight": self.upstream_in_flight,
+                "models": {model: stats.to_dict() for model, stats in self._models.items()},
+            }
+
+
+class _CompletionHandler(http.server.BaseHTTPRequestHandler):
+    """OpenAI 兼容的请求处理器，每个连接在独立线程中处理"""
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.api_server.metrics.add_bytes(bytes_out=len(body))
+
+    def do_GET(self):
+        api_server = self.server.api_server
+        if self.path == '/healthz':
+            if api_server.is_running:
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(503, {"status": "stopping"})
+        elif self.path == '/metrics':
+            snapshot = api_server.metrics.snapshot()
+            snapshot["scheduler"] = api_server.scheduler.snapshot()
+            self._send_json(200, snapshot)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def do_POST(self):
+        if self.path == '/v1/chat/completions':
+            api_server = self.server.api_server
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            api_server.metrics.add_bytes(bytes_in=content_length)
+
+            start_time = time.perf_counter()
+            model = DEFAULT_MODEL
+            try:
+                request_data = json.loads(post_data.decode('utf-8'))
+                model = request_data.get("model", DEFAULT_MODEL)
+                # 请求头 Cache-Control: no-cache 时跳过缓存读取
+                bypass_cache = 'no-cache' in (self.headers.get('Cache-Control') or '')
+                if request_data.get("stream"):
+                    ok = self._stream_completion(api_server, request_data, bypass_cache, start_time)
+                    api_server.metrics.record_request(model, time.perf_counter() - start_time, error=not ok)
+                    return
+                response = api_server.handle_completion(request_data, bypass_cache)
+                api_server.metrics.record_request(model, time.perf_counter() - start_time)
+
+                self._send_json(200, response)
+            except Exception as e:
+                api_server.metrics.record_request(model, time.perf_counter() - start_time, error=True)
+                self._send_json(500, {"error": str(e)})
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _stream_completion(self, api_server, request_data, bypass_cache, start_time):
+        """以 server-sent events 形式转发流式响应，返回是否完整发送"""
+        chunks = api_server.stream_completion(request_data, bypass_cache)
+        # 先取到首个块再发送响应头，上游在开始前失败时仍可返回 500
+        first_chunk = next(chunks, None)
+        api_server.metrics.record_ttft(
+            request_data.get("model", DEFAULT_MODEL), time.perf_counter() - start_time
+        )
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.close_connection = True  # 无 Content-Length，以关闭连接标记结束
+
+        def write_event(data):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(payload)
+            self.wfile.flush()
+            api_server.metrics.add_bytes(bytes_out=len(payload))
+
+        try:
+            if first_chunk is not None:
+                write_event(json.dumps(first_chunk))
+            for chunk in chunks:
+                write_event(json.dumps(chunk))
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开，关闭生成器以释放上游连接
+            chunks.close()
+            return False
+        except Exception as e:
+            # 响应头已发送，只能以错误事件通知客户端
+            write_event(json.dumps({"error": str(e)}))
+            return False
+        write_event("[DONE]")
+        return True
+
+    def log_message(self, format, *args):
+        _log.debug("%s - %s", self.address_string(), format % args)
+
+
+# 创建一个自定义的 API 服务器模拟器
+class GeminiAPIServer:
+    """本地 OpenAI 兼容代理，通过 liteLLM 转发到 Gemini
+
+    使用多线程 HTTP 服务器并发处理请求，max_inflight 限制同时进行的上游调用数，
+    超出的请求在服务器内排队等待，而不是阻塞在单个 socket 上。
+    相同模型、消息（含图片）和参数的请求从磁盘缓存返回，use_cache=False 时完全绕过缓存。
+    请求中 stream=True 时以 OpenAI 风格的 server-sent events 逐块返回。
+    上游调用经 UpstreamScheduler 按 requests_per_minute/tokens_per_minute 限速，
+    429 和临时错误退避重试，被限流时自动降低并发。
+    """
+    def __init__(self, port: int = 4000, max_inflight: int = 8, use_cache: bool = True,
+                 cache_dir: str = "./output/.cache/gemini", cache_max_bytes: int = 1 << 30,
+                 requests_per_minute=None, tokens_per_minute=None, max_retries: int = 5):
+        self.port = port  # 为 0 时由系统分配空闲端口，启动后更新为实际端口
+        self.max_inflight = max_inflight
+        self.is_running = False
+        self.server_thread = None
+        self.httpd = None
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.model_cache = None  # 在 start() 中创建，避免仅导入模块时创建目录
+        self.metrics = ProxyMetrics()
+        self._upstream_slots = threading.BoundedSemaphore(max_inflight)
+        self.scheduler = UpstreamScheduler(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_concurrency=max_inflight,
+            max_retries=max_retries,
+            slots=self._upstream_slots,
+        )
+
+    @staticmethod
+    def cache_key(model, messages, temperature, max_tokens):
+        """由模型、消息和采样参数计算缓存键"""
+        return digest(dict(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        ))
+
+    def _lookup_cache(self, model, messages, temperature, max_tokens, bypass_cache):
+        """返回 (缓存键, 缓存的响应)，未启用缓存时键为 None"""
+        if self.model_cache is None:
+            return None, None
+        key = self.cache_key(model, messages, temperature, max_tokens)
+        if bypass_cache:
+            return key, None
+        cached = self.model_cache.get(key)
+        if cached is not None:
+            self.metrics.record_cache_hit(model)
+        return key, cached
+
+    def handle_completion(self, request_data, bypass_cache: bool = False):
+        """调用上游模型并返回 OpenAI 格式的响应"""
+        model = request_data.get("model", DEFAULT_MODEL)
+        messages = request_data.get("messages", [])
+        temperature = request_data.get("temperature", 0.1)
+        max_tokens = request_data.get("max_tokens", 65536)
+
+        key, cached = self._lookup_cache(model, messages, temperature, max_tokens, bypass_cache)
+        if cached is not None:
+            return cached
+
+        import litellm
+
+        # 使用 liteLLM 进行实际调用，调度器在每次尝试时占用上游并发名额，退避期间不占用
+        self.metrics.upstream_started()
+        try:
+            response = self.scheduler.run(lambda: litellm.completion(
+                model=f"gemini/{model}",
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ))
+        except Exception:
+            self.metrics.record_upstream_error(model)
+            raise
+        finally:
+            self.metrics.upstream_finished()
+
+        # 确保响应格式符合 OpenAI 标准
+        result = {
+            "id": response.id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": response.choices[0].message.content
+                    },
+                    "finish_reason": "stop"
+                }
+            ],
+            "usage": response.usage.dict() if response.usage else {}
+        }
+        self.metrics.record_usage(model, result["usage"])
+        self.scheduler.record_usage(result["usage"].get("total_tokens"))
+
+        if key is not None:
+            self.model_cache.put(key, result)
+        return result
+
+    def stream_completion(self, request_data, bypass_cache: bool = False):
+        """流式调用上游模型，逐个产出 OpenAI chat.completion.chunk 格式的块
+
+        完整内容在流结束后写入缓存；缓存命中时以单个内容块返回。
+        """
+        model = request_data.get("model", DEFAULT_MODEL)
+        messages = request_data.get("messages", [])
+        temperature = request_data.get("temperature", 0.1)
+        max_tokens = request_data.get("max_tokens", 65536)
+        created = int(time.time())
+
+        def make_chunk(chunk_id, delta, finish_reason=None):
+            return {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        key, cached = self._lookup_cache(model, messages, temperature, max_tokens, bypass_cache)
+        if cached is not None:
+            message = cached["choices"][0]["message"]
+            yield make_chunk(cached["id"], {"role": "assistant", "content": message["content"]})
+            yield make_chunk(cached["id"], {}, "stop")
+            return
+
+        import litellm
+
+        content_parts = []
+        usage = {}
+        chunk_id = None
+        self.metrics.upstream_started()
+        # 只有建立流之前的错误会重试，流中途的错误直接返回给客户端；
+        # 上游并发名额和限制器名额一直占用到流读完
+        response = self.scheduler.stream(lambda: litellm.completion(
+            model=f"gemini/{model}",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        ))
+        try:
+            for chunk in response:
+                chunk_id = chunk_id or chunk.id
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage.dict()
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    content_parts.append(text)
+                    yield make_chunk(chunk_id, {"content": text})
+        except GeneratorExit:
+            raise
+        except Exception:
+            self.metrics.record_upstream_error(model)
+            raise
+        finally:
+            response.close()  # 客户端断开时立即释放名额
+            self.metrics.upstream_finished()
+
+        yield make_chunk(chunk_id, {}, "stop")
+        self.metrics.record_usage(model, usage)
+        self.scheduler.record_usage(usage.get("total_tokens"))
+
+        if key is not None:
+            self.model_cache.put(key, {
+                "id": chunk_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(content_parts)},
+                        "finish_reason": "stop"
+                    }
+                ],
+                "usage": usage,
+            })
+
+    def start(self):
+        """启动 API 服务器"""
+        if self.use_cache and self.model_cache is None:
+            self.model_cache = DiskCache(self.cache_dir, self.cache_max_bytes)
+
+        # 在当前线程绑定端口，端口被占用时立即抛出异常
+        httpd = http.server.ThreadingHTTPServer(("", self.port), _CompletionHandler)
+        httpd.daemon_threads = True
+        httpd.api_server = self
+        self.httpd = httpd
+        self.port = httpd.server_address[1]
+
+        self.is_running = True
+        self.server_thread = threading.Thread(
+            target=httpd.serve_forever, kwargs=dict(poll_interval=0.5), daemon=True
+        )
+        self.server_thread.start()
+        self.wait_ready()
+
+    def wait_ready(self, timeout: float = 10.0):
+        """轮询 /healthz，直到服务器可以响应请求"""
+        url = f"http://127.0.0.1:{self.port}/healthz"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as resp:
+                    if resp.status == 200:
+                        return
+            except OSError:
+                pass
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"API 服务器在 {timeout} 秒内未就绪")
+            time.sleep(0.05)
+
+    def stop(self):
+        """停止 API 服务器"""
+        self.is_running = False
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.server_thread:
+            self.server_thread.join(timeout=5)
+        logging.info("API 服务器已停止")
+
+
+def gemini_vlm_options(model: str, prompt: str, timeout: int = 300, api_port: int = 4000,
+                       concurrency: int = 4):
+    """配置 Gemini 的 VLM 选项
+
+    concurrency 为 VLM 流水线同时发往代理的页面请求数。
+    """
+    from docling.datamodel.pipeline_options import ApiVlmOptions, ResponseFormat
+
+    options = ApiVlmOptions(
+        url=f"http://localhost:{api_port}/v1/chat/completions",
+        params=dict(
+            model=model,
+            max_tokens=65536,
+            temperature=1,
+        ),
+        prompt=prompt,
+        timeout=timeout,
+        scale=1.0, # 图片缩放比例
+        response_format=ResponseFormat.MARKDOWN,
+        concurrency=concurrency,
+    )
+    return options
@@ -0,0 +1,103 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# 格式 -> (文件扩展名, MIME 类型)
+_FORMATS = {
+    "PNG": ("png", "image/png"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+}
+
+
+class ImageEncodingOptions:
+    """导出图片的编码配置
+
+    format: PNG / JPEG / WEBP
+    quality: JPEG/WEBP 的有损质量（1-100）
+    lossless: WEBP 是否使用无损模式
+    max_dimension: 最长边上限（像素），超过时等比缩小；None 表示不缩放
+    compress_level: PNG 的 zlib 压缩级别（0-9），越小越快
+    optimize: PNG/JPEG 是否做额外的体积优化（更慢）
+    默认值与 PIL 保存 PNG 的默认行为一致。
+    """
+    def __init__(self, format="PNG", quality=85, lossless=False, max_dimension=None,
+                 compress_level=6, optimize=False):
+        format = format.upper()
+        if format == "JPG":
+            format = "JPEG"
+        if format not in _FORMATS:
+            raise ValueError(f"不支持的图片格式: {format}")
+        self.format = format
+        self.quality = quality
+        self.lossless = lossless
+        self.max_dimension = max_dimension
+        self.compress_level = compress_level
+        self.optimize = optimize
+
+    @property
+    def extension(self):
+        return _FORMATS[self.format][0]
+
+    @property
+    def content_type(self):
+        return _FORMATS[self.format][1]
+
+    @property
+    def is_default(self):
+        """是否为与原始导出完全相同的无损 PNG"""
+        return self.format == "PNG" and self.max_dimension is None
+
+    @property
+    def tag(self):
+        """描述编码参数的短标签，用于区分同一图片的不同编码结果"""
+        if self.format == "PNG":
+            parts = ["png"]
+        elif self.format == "WEBP" and self.lossless:
+            parts = ["webp", "lossless"]
+        else:
+            parts = [self.extension, f"q{self.quality}"]
+        if self.max_dimension:
+            parts.append(f"max{self.max_dimension}")
+        return "-".join(parts)
+
+    def save_kwargs(self):
+        """传给 PIL Image.save 的编码参数"""
+        if self.format == "PNG":
+            return dict(compress_level=self.compress_level, optimize=self.optimize)
+        if self.format == "JPEG":
+            return dict(quality=self.quality, optimize=self.optimize)
+        return dict(quality=self.quality, lossless=self.lossless, method=4)
+
+
+def prepare_image(image, options):
+    """按配置缩放图片并转换为目标格式支持的颜色模式"""
+    if options.max_dimension and max(image.size) > options.max_dimension:
+        image = image.copy()
+        image.thumbnail((options.max_dimension, options.max_dimension), Image.LANCZOS)
+    if options.format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image
+
+
+def encode_image(image, options, fp):
+    """按配置编码图片，写入文件路径或文件对象"""
+    prepare_image(image, options).save(fp, format=options.format, **options.save_kwargs())
+
+
+def encode_to_buffer(image, options):
+    """编码图片到内存，返回已定位到开头的 BytesIO"""
+    buffer = io.BytesIO()
+    encode_image(image, options, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def encode_images(jobs, options, workers=4):
+    """并行编码多张图片到文件，jobs 为 (image, path) 列表
+
+    PIL 的编码器在压缩时会释放 GIL，线程池即可利用多核。
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda job: encode_image(job[0], options, job[1]), jobs))
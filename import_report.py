@@ -0,0 +1,66 @@
+import argparse
+import re
+import subprocess
+import sys
+
+# python -X importtime 的输出格式：import time: self [us] | cumulative | imported package
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_imports(module: str):
+    """在子进程中导入 module，返回 (总耗时秒数, [(模块名, 自身秒数, 累计秒数, 层级)])
+
+    使用新进程保证测得的是冷启动耗时，不受当前进程已导入模块的影响。
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us = int(m.group(1)), int(m.group(2))
+        depth = (len(m.group(3)) - 1) // 2
+        rows.append((m.group(4), self_us / 1e6, cumulative_us / 1e6, depth))
+        if depth == 0:
+            total_us += cumulative_us
+    return total_us / 1e6, rows
+
+
+def print_report(module: str, total: float, rows, top: int = 20):
+    """打印按累计耗时排序的模块导入耗时表"""
+    print(f"导入 {module} 总耗时: {total:.3f} 秒")
+    print(f"{'累计(秒)':>10} {'自身(秒)':>10}  模块")
+    for name, self_s, cumulative_s, depth in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"{cumulative_s:>10.3f} {self_s:>10.3f}  {'  ' * depth}{name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计入口脚本的模块导入耗时")
+    parser.add_argument("modules", nargs="+", help="要检查的模块名，如 main_custom_oss_serializer")
+    parser.add_argument("--top", type=int, default=20, help="每个模块显示耗时最多的前 N 项")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="导入耗时上限（秒），任一模块超出时以非零状态退出")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        total, rows = measure_imports(module)
+        print_report(module, total, rows, args.top)
+        print()
+        if args.budget is not None and total > args.budget:
+            over_budget.append((module, total))
+
+    for module, total in over_budget:
+        print(f"{module} 导入耗时 {total:.3f} 秒，超过预算 {args.budget:.3f} 秒")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import json
 import logging
 import time
 from pathlib import Path
@@ -11,6 +10,8 @@ from docling.datamodel.pipeline_options import (
 )
 from docling.document_converter import DocumentConverter, PdfFormatOption
 
+from multi_export import export_document
+
 _log = logging.getLogger(__name__)
 
 def main():
@@ -93,25 +94,9 @@ def main():
     _log.info(f"Document converted in {end_time:.2f} seconds.")
 
     ## Export results
-    output_dir = Path("scratch")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    doc_filename = conv_result.input.file.stem
-
-    # Export Deep Search document JSON format:
-    with (output_dir / f"{doc_filename}.json").open("w", encoding="utf-8") as fp:
-        fp.write(json.dumps(conv_result.document.export_to_dict()))
-
-    # Export Text format:
-    with (output_dir / f"{doc_filename}.txt").open("w", encoding="utf-8") as fp:
-        fp.write(conv_result.document.export_to_text())
-
-    # Export Markdown format:
-    with (output_dir / f"{doc_filename}.md").open("w", encoding="utf-8") as fp:
-        fp.write(conv_result.document.export_to_markdown())
-
-    # Export Document Tags format:
-    with (output_dir / f"{doc_filename}.doctags").open("w", encoding="utf-8") as fp:
-        fp.write(conv_result.document.export_to_document_tokens())
+    # 一次遍历同时写出 JSON、纯文本、Markdown 和 DocTags，输出与各 export_to_* 相同
+    paths = export_document(conv_result.document, Path("scratch"), conv_result.input.file.stem)
+    _log.info(f"Exported: {', '.join(str(p) for p in paths.values())}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
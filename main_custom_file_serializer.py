@@ -1,12 +1,13 @@
 from docling.datamodel.base_models import InputFormat
 from docling.datamodel.pipeline_options import (
-    PdfPipelineOptions,
     RapidOcrOptions,
     PictureDescriptionVlmOptions,
     PictureDescriptionApiOptions,
 )
 from docling.document_converter import DocumentConverter, PdfFormatOption
 
+from page_image_store import SpillingPdfPipeline, SpillingPdfPipelineOptions
+
 
 # DOC_SOURCE = "https://arxiv.org/pdf/2311.18481"
 DOC_SOURCE = "./test3/2025-05-20.pdf"
@@ -36,14 +37,11 @@ def vllm_local_options(model: str):
     return options
 
 # 中文检测和识别，使用 RapidOCR 模型
-import os
-from huggingface_hub import snapshot_download
 from typing import List
+from model_resolver import resolve_rapidocr_models
 
-download_path = snapshot_download(repo_id="SWHL/RapidOCR")
-det_model_path = os.path.join(download_path, "PP-OCRv4", "ch_PP-OCRv4_det_infer.onnx")      # 检测模型
-rec_model_path = os.path.join(download_path, "PP-OCRv4", "ch_PP-OCRv4_rec_server_infer.onnx") # 中文识别
-cls_model_path = os.path.join(download_path, "PP-OCRv3", "ch_ppocr_mobile_v2.0_cls_train.onnx") # 方向分类
+# 检测模型、中文识别、方向分类，本地已有且校验通过时不访问 Hugging Face
+det_model_path, rec_model_path, cls_model_path = resolve_rapidocr_models()
 
 lang: List[str] = ['english', 'chinese']
 
@@ -56,8 +54,8 @@ ocr_options = RapidOcrOptions(
 
 # 设置 pipeline 选项，包括两个部分：
 # 1. 图片描述
-# 2. 图片生成
-pipeline_options = PdfPipelineOptions(
+# 2. 图片生成（页面图片写入磁盘缓存，内存中最多保留 page_ram_budget_mb 的页面）
+pipeline_options = SpillingPdfPipelineOptions(
     do_picture_description=True,
     picture_description_options=vllm_local_options("qwen2.5vl:latest"),
     enable_remote_services=True,
@@ -66,6 +64,7 @@ pipeline_options = PdfPipelineOptions(
     generate_picture_images = True,
     ocr_options=ocr_options,
     do_picture_classification = True,
+    page_ram_budget_mb=256,
     # do_code_enrichment = True,
     # do_ocr = True,
     # do_table_structure = True,
@@ -76,7 +75,9 @@ pipeline_options = PdfPipelineOptions(
 
 # 创建 DocumentConverter 对象，完成 pdf 文件的转换
 converter = DocumentConverter(
-    format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+    format_options={InputFormat.PDF: PdfFormatOption(
+        pipeline_options=pipeline_options, pipeline_cls=SpillingPdfPipeline
+    )}
 )
 doc = converter.convert(source=DOC_SOURCE).document
 
@@ -88,7 +89,14 @@ doc = converter.convert(source=DOC_SOURCE).document
 from pydantic import AnyUrl, BaseModel
 from pathlib import Path
 from docling_core.types.doc import PictureItem
+from image_encoding import ImageEncodingOptions, encode_images
+
+# 图片编码配置，例如 ImageEncodingOptions(format="WEBP", quality=80, max_dimension=1600)
+image_encoding = ImageEncodingOptions()
+image_dir = Path("./output/images")
+image_dir.mkdir(parents=True, exist_ok=True)
 
+encode_jobs = []
 img_count = 0
 for item, level in doc.iterate_items(with_groups=False):
     if isinstance(item, PictureItem):
@@ -99,15 +107,17 @@ for item, level in doc.iterate_items(with_groups=False):
         # 生成图片的hash值, 用于生成图片的唯一标识, 存入本地
         hexhash = item._image_to_hexhash()
         if hexhash is not None:
-            file_name = f"image_{img_count:06}_{hexhash}.png"
-            loc_path = Path("./output/images") / file_name
-            img.save(loc_path)  
+            file_name = f"image_{img_count:06}_{hexhash}.{image_encoding.extension}"
+            encode_jobs.append((img, image_dir / file_name))
 
             # 设置图片路径  
             obj_path = Path("./images") / file_name
             item.image.uri = Path(obj_path)
     img_count += 1
 
+# 并行编码并保存所有图片
+encode_images(encode_jobs, image_encoding, workers=4)
+
 
 
 
@@ -1,37 +1,22 @@
+# docling、docling_core、oss2、rich 等较重的依赖都在用到时才导入，
+# 可用 `python import_report.py main_custom_oss_serializer` 查看各模块的导入耗时
 import os
-import io
-import re
+import json
 import logging
-import oss2
-from typing import List, Any, Optional
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
 from pathlib import Path
 from dotenv import load_dotenv
-from rich.console import Console
-from rich.panel import Panel
-from huggingface_hub import snapshot_download
-from typing_extensions import override
-
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import (
-    PdfPipelineOptions,
-    RapidOcrOptions,
-    PictureDescriptionVlmOptions,
-    PictureDescriptionApiOptions,
-)
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling_core.transforms.serializer.markdown import MarkdownDocSerializer, MarkdownParams
-from docling_core.transforms.chunker.hierarchical_chunker import TripletTableSerializer
-from docling_core.transforms.serializer.base import BaseDocSerializer, SerializationResult
-from docling_core.transforms.serializer.common import create_ser_result
-from docling_core.transforms.serializer.markdown import MarkdownPictureSerializer
-from docling_core.types.doc.document import (
-    DoclingDocument,
-    ImageRefMode,
-    PictureDescriptionData,
-    PictureClassificationData,
-    PictureItem,
-)
-from docling_core.types.doc import PictureItem
+
+from converter_registry import get_converter
+from document_cache import DocumentCache
+from markdown_stream import write_markdown
+from stage_profiler import StageProfiler
+from image_encoding import ImageEncodingOptions, encode_image, encode_to_buffer
+from model_resolver import resolve_rapidocr_models
 
 
 class ConfigManager:
@@ -46,19 +31,29 @@ class ConfigManager:
 class ConsolePrinter:
     """控制台输出类，用于格式化输出信息"""
     def __init__(self, width=210):
+        from rich.console import Console
+
         self.console = Console(width=width)  # 防止 Markdown 表格换行渲染
         
     def print_panel(self, text):
         """在面板中打印文本"""
+        from rich.panel import Panel
+
         self.console.print(Panel(text))
 
 
 class VlmConfiguration:
     """VLM配置类，处理视觉语言模型的配置"""
     @staticmethod
-    def get_local_options(model):
-        """获取本地VLM模型的配置选项"""
-        return PictureDescriptionApiOptions(
+    def get_local_options(model, concurrency=4, cache_dir="./output/.picture_description_cache"):
+        """获取本地VLM模型的配置选项
+
+        同时发出 concurrency 个描述请求，结果按图片内容缓存在 cache_dir 中（None 表示不缓存），
+        需要配合 PictureDescriptionPdfPipeline 使用。
+        """
+        from picture_description import CachedPictureDescriptionApiOptions
+
+        return CachedPictureDescriptionApiOptions(
             url="http://localhost:11434/v1/chat/completions",
             params=dict(
                 model=model,
@@ -67,6 +62,8 @@ class VlmConfiguration:
             ),
             prompt="Describe the image in three sentences. Be consise and accurate.",
             timeout=90,
+            concurrency=concurrency,
+            cache_dir=cache_dir,
         )
 
 
@@ -75,10 +72,10 @@ class OcrConfiguration:
     @staticmethod
     def get_rapid_ocr_options():
         """获取RapidOCR模型的配置选项"""
-        download_path = snapshot_download(repo_id="SWHL/RapidOCR")
-        det_model_path = os.path.join(download_path, "PP-OCRv4", "ch_PP-OCRv4_det_infer.onnx")      # 检测模型
-        rec_model_path = os.path.join(download_path, "PP-OCRv4", "ch_PP-OCRv4_rec_server_infer.onnx") # 中文识别
-        cls_model_path = os.path.join(download_path, "PP-OCRv3", "ch_ppocr_mobile_v2.0_cls_train.onnx") # 方向分类
+        from docling.datamodel.pipeline_options import RapidOcrOptions
+
+        # 模型路径从本地清单解析，文件已存在且校验通过时不访问 Hugging Face
+        det_model_path, rec_model_path, cls_model_path = resolve_rapidocr_models()
 
         lang: List[str] = ['english', 'chinese']
 
@@ -91,12 +88,30 @@ class OcrConfiguration:
 
 
 class OssImageUploader:
-    """OSS图片上传类，处理图片上传到阿里云OSS的逻辑"""
-    def __init__(self):
+    """OSS图片上传类，处理图片上传到阿里云OSS的逻辑
+
+    对象名只由图片内容哈希决定，已上传过的图片记录在本地索引中，
+    再次遇到时直接返回URL，不再编码和上传。
+    所有请求共享一个大小为 pool_size 的连接池；估算大小超过 multipart_threshold
+    的图片先编码到 resumable_dir 下以对象名命名的文件，再以多线程断点续传的分片方式上传。
+    上传失败时保留该文件和断点记录，下次上传同一对象时从断点继续，成功后删除。
+    encoding 指定图片的编码格式、质量和尺寸上限，默认为无损 PNG。
+    自定义域名在第一次构建URL时才查询，结果缓存在 domain_cache_path 中，
+    domain_cache_ttl 秒内不再请求OSS。
+    上传索引只在内存中更新，每新增 index_flush_every 条或调用 flush_index() 时写回文件。
+    """
+    def __init__(self, index_path="./output/.oss_index.json", check_remote=True,
+                 pool_size=16, multipart_threshold=5 * 1024 * 1024,
+                 part_size=1024 * 1024, multipart_threads=4,
+                 resumable_dir="./output/.oss_resumable", encoding=None,
+                 domain_cache_path="./output/.oss_domain_cache.json", domain_cache_ttl=24 * 3600,
+                 index_flush_every=100):
         # 配置日志
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
         
+        import oss2
+
         # 加载.env文件中的环境变量
         load_dotenv()
         
@@ -106,13 +121,147 @@ class OssImageUploader:
         self.access_key_secret = os.getenv('OSS_ACCESS_KEY_SECRET')
         self.bucket_name = os.getenv('OSS_BUCKET_NAME')
         
-        # 初始化OSS客户端
+        # 图片编码配置
+        self.encoding = encoding or ImageEncodingOptions()
+
+        # 分片上传配置
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.multipart_threads = multipart_threads
+        self.resumable_store = oss2.ResumableStore(root=str(Path(resumable_dir).resolve()))
+        # 待分片上传的编码文件，路径由对象名决定，重试时断点记录才能对应上
+        self.resumable_files_dir = Path(resumable_dir) / "files"
+        self._resumable_locks = {}
+        self._resumable_locks_lock = threading.Lock()
+
+        # 初始化OSS客户端，显式指定连接池大小，供并发上传和分片线程共用
         self.auth = oss2.Auth(self.access_key_id, self.access_key_secret)
-        self.bucket = oss2.Bucket(self.auth, self.endpoint, self.bucket_name)
+        self.bucket = oss2.Bucket(
+            self.auth, self.endpoint, self.bucket_name,
+            session=oss2.Session(pool_size=pool_size),
+        )
         
-        # 获取自定义域名
-        self.custom_domain = self._get_custom_domain()
+        # 自定义域名延迟到第一次使用时获取
+        self.domain_cache_path = Path(domain_cache_path)
+        self.domain_cache_ttl = domain_cache_ttl
+        self._custom_domain = None
+        self._domain_resolved = False
+        self._domain_lookup_failed = False
+        self._domain_lock = threading.Lock()
+
+        # 已上传对象的本地索引；check_remote 为 True 时，索引未命中会先查询对象是否已存在
+        self.check_remote = check_remote
+        self.index_path = Path(index_path)
+        self._index_lock = threading.Lock()
+        self._index = self._load_index()
+        self.index_flush_every = index_flush_every
+        self._index_unsaved = 0  # 尚未写回文件的新条目数
+        self._flush_lock = threading.Lock()  # 串行化索引文件的写入
     
+    def _load_index(self):
+        """读取本地上传索引"""
+        if not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.warning(f"读取上传索引失败，将重新建立: {str(e)}")
+            return {}
+
+    def _index_key(self, oss_path):
+        return f"{self.bucket_name}/{oss_path}"
+
+    def _is_uploaded(self, oss_path):
+        """对象是否已在Bucket中：先查本地索引，再按需查询OSS"""
+        with self._index_lock:
+            if self._index_key(oss_path) in self._index:
+                return True
+        if self.check_remote:
+            try:
+                if self.bucket.object_exists(oss_path):
+                    self._mark_uploaded(oss_path)
+                    return True
+            except Exception as e:
+                self.logger.warning(f"查询对象是否存在时出错: {str(e)}")
+        return False
+
+    def _mark_uploaded(self, oss_path):
+        """在本地索引中记录已上传的对象，积累到 index_flush_every 条时写回文件"""
+        with self._index_lock:
+            self._index[self._index_key(oss_path)] = True
+            self._index_unsaved += 1
+            flush = self._index_unsaved >= self.index_flush_every
+        if flush:
+            self.flush_index()
+
+    def flush_index(self):
+        """把内存中的上传索引原子地写回文件，没有新条目时不写"""
+        with self._flush_lock:
+            with self._index_lock:
+                if not self._index_unsaved:
+                    return
+                data = json.dumps(self._index)
+                self._index_unsaved = 0
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+
+    def _object_url(self, oss_path):
+        """根据是否有自定义域名构建OSS URL"""
+        if self.custom_domain:
+            # 使用自定义域名构建URL
+            return f"https://{self.custom_domain}/{oss_path}"
+        # 使用默认OSS域名构建URL
+        return f"https://{self.bucket.bucket_name}.{self.endpoint}/{oss_path}"
+    
+    @property
+    def custom_domain(self):
+        """Bucket绑定的自定义域名，优先使用未过期的磁盘缓存"""
+        with self._domain_lock:
+            if not self._domain_resolved:
+                cached = self._read_domain_cache()
+                if cached is not None:
+                    self._custom_domain = cached["domain"]
+                else:
+                    self._custom_domain = self._get_custom_domain()
+                    # 查询出错时不写缓存，下次运行重新查询
+                    if not self._domain_lookup_failed:
+                        self._write_domain_cache(self._custom_domain)
+                self._domain_resolved = True
+            return self._custom_domain
+
+    def _domain_cache_key(self):
+        return f"{self.bucket_name}@{self.endpoint}"
+
+    def _read_domain_cache(self):
+        """读取未过期的自定义域名缓存，没有时返回None"""
+        try:
+            with open(self.domain_cache_path, "r", encoding="utf-8") as f:
+                entry = json.load(f).get(self._domain_cache_key())
+        except (OSError, ValueError):
+            return None
+        if entry and time.time() - entry.get("resolved_at", 0) < self.domain_cache_ttl:
+            return entry
+        return None
+
+    def _write_domain_cache(self, domain):
+        """把解析出的自定义域名写入磁盘缓存"""
+        try:
+            with open(self.domain_cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[self._domain_cache_key()] = dict(domain=domain, resolved_at=time.time())
+        try:
+            self.domain_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.domain_cache_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        except OSError as e:
+            self.logger.warning(f"写入自定义域名缓存失败: {str(e)}")
+
     def _get_custom_domain(self):
         """获取OSS Bucket绑定的自定义域名"""
         try:
@@ -134,29 +283,32 @@ class OssImageUploader:
                 return None
         except Exception as e:
             self.logger.error(f"获取自定义域名时出错: {str(e)}")
+            self._domain_lookup_failed = True
             return None
     
     def upload_image(self, image, image_hash, img_count):
-        """上传图片到OSS，返回URL或本地路径"""
-        file_name = f"image_{img_count:06}_{image_hash}.png"
-        
-        # 将图片转换为字节流
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
+        """上传图片到OSS，返回URL或本地路径
+
+        对象名由图片内容哈希决定（非默认编码时附加编码标签），img_count 仅用于日志。
+        """
+        if self.encoding.is_default:
+            file_name = f"{image_hash}.png"
+        else:
+            file_name = f"{image_hash}_{self.encoding.tag}.{self.encoding.extension}"
+        oss_path = f"docling/{file_name}"
+
+        # 相同内容的图片已上传过时直接返回URL
+        if self._is_uploaded(oss_path):
+            oss_url = self._object_url(oss_path)
+            self.logger.info(f"图片 {img_count} 已存在，跳过上传: {oss_url}")
+            return oss_url
         
         # 上传到OSS
-        oss_path = f"docling/{file_name}"
         try:
-            result = self.bucket.put_object(oss_path, img_byte_arr)
+            result = self._put_image(image, oss_path)
             if result.status == 200:
-                # 根据是否有自定义域名构建OSS URL
-                if self.custom_domain:
-                    # 使用自定义域名构建URL
-                    oss_url = f"https://{self.custom_domain}/{oss_path}"
-                else:
-                    # 使用默认OSS域名构建URL
-                    oss_url = f"https://{self.bucket.bucket_name}.{self.endpoint}/{oss_path}"
+                self._mark_uploaded(oss_path)
+                oss_url = self._object_url(oss_path)
                 
                 self.logger.info(f"上传图片成功: {oss_url}")
                 return oss_url
@@ -171,6 +323,48 @@ class OssImageUploader:
             local_path = self._save_locally(image, file_name)
             return local_path
     
+    def _put_image(self, image, oss_path):
+        """编码并上传图片，大图走分片上传"""
+        import oss2
+
+        # 显式设置 Content-Type，JPEG/WebP 在浏览器中才能按正确的类型显示
+        headers = {"Content-Type": self.encoding.content_type}
+
+        # 未压缩大小超过阈值时，编码结果可能也很大，写到临时文件后分片上传
+        raw_size = image.width * image.height * len(image.getbands())
+        if raw_size < self.multipart_threshold:
+            # 将图片转换为字节流，直接传入文件对象，避免再复制一份字节
+            img_byte_arr = encode_to_buffer(image, self.encoding)
+            return self.bucket.put_object(oss_path, img_byte_arr, headers=headers)
+
+        # 同一文档中内容相同的图片会得到相同的对象名，同一对象的分片上传串行进行
+        with self._resumable_locks_lock:
+            lock = self._resumable_locks.setdefault(oss_path, threading.Lock())
+        with lock:
+            # 断点记录以本地文件路径和对象名为键，文件路径必须固定，且失败时保留文件
+            file_path = self.resumable_files_dir / Path(oss_path).name
+            if not file_path.exists():
+                self.resumable_files_dir.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.resumable_files_dir, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        encode_image(image, self.encoding, f)
+                    os.replace(tmp_path, file_path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+            # 编码后仍小于阈值时 resumable_upload 会自动改用普通上传
+            result = oss2.resumable_upload(
+                self.bucket, oss_path, str(file_path),
+                store=self.resumable_store,
+                headers=headers,
+                multipart_threshold=self.multipart_threshold,
+                part_size=self.part_size,
+                num_threads=self.multipart_threads,
+            )
+            os.remove(file_path)
+            return result
+
     def _save_locally(self, image, file_name):
         """将图片保存到本地，返回路径"""
         # 确保输出目录存在
@@ -178,72 +372,42 @@ class OssImageUploader:
         output_dir.mkdir(parents=True, exist_ok=True)
         
         loc_path = output_dir / file_name
-        image.save(loc_path)
+        if not loc_path.exists():  # 文件名由内容哈希决定，已存在即为相同图片
+            encode_image(image, self.encoding, loc_path)
         return Path("./images") / file_name
 
 
-class AnnotationPictureSerializer(MarkdownPictureSerializer):
-    """自定义图片序列化器，添加图片自定义属性和描述"""
-    def __init__(self, doc_alignment, doc_width, show_description):
-        super().__init__()
-        self.doc_alignment = doc_alignment
-        self.doc_width = doc_width
-        self.show_description = show_description
-
-    @override
-    def serialize(
-        self,
-        *,
-        item: PictureItem,
-        doc_serializer: BaseDocSerializer,
-        doc: DoclingDocument,
-        separator: Optional[str] = None,
-        **kwargs: Any,
-    ) -> SerializationResult:
-        text_parts: list[str] = []
-
-        # 1. 调用父类的 serialize 方法获取原始的 Markdown 图片标签
-        parent_res = super().serialize(
-            item=item,
-            doc_serializer=doc_serializer,
-            doc=doc,
-            **kwargs,
-        )
-        original_markdown_tag = parent_res.text
-        modified_markdown_tag = original_markdown_tag
-
-        # 2. 解析原始标签并替换为自定义格式
-        match = re.fullmatch(r"!\[(.*?)\]\((.*?)\)", original_markdown_tag)
-        
-        if match:
-            url = match.group(2)
-            new_alt_text_with_attrs = f"Image|{self.doc_alignment}|{self.doc_width}"
-            modified_markdown_tag = f"![{new_alt_text_with_attrs}]({url})"
-        
-        text_parts.append(modified_markdown_tag)
-
-        # 3. 追加其他注解
-        if self.show_description:
-            for annotation in item.annotations:
-                if isinstance(annotation, PictureDescriptionData):
-                    text_parts.append(f"> Picture Description: {annotation.text}")
-
-        # 4. 使用分隔符连接所有部分
-        text_res = (separator or "\n").join(text_parts)
-        
-        # 5. 创建并返回序列化结果
-        return create_ser_result(text=text_res, span_source=item)
-
-
 class DocumentProcessor:
     """文档处理类，负责整个文档处理流程"""
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, upload_workers=8, image_encoding=None, profiler=None,
+                 page_workers=1, document_cache=None):
         self.config = config_manager
-        self.oss_uploader = OssImageUploader()
+        self.image_encoding = image_encoding
+        self.upload_workers = upload_workers  # 并发上传图片的线程数
+        self.page_workers = page_workers  # 大于 1 时按页码区间拆分，在多个进程中并行转换
+        # 阶段计时，默认关闭；传入 StageProfiler() 可记录各阶段耗时并导出 Chrome trace
+        self.profiler = profiler or StageProfiler(enabled=False)
+        # 转换结果缓存（DocumentCache），None 表示每次都重新转换
+        self.document_cache = document_cache
+        self._oss_uploader = None
+        self._uploader_lock = threading.Lock()
+        # 已转换、页面图片尚未从落盘缓存中删除的文档哈希
+        self._unreleased_documents = []
+
+    @property
+    def oss_uploader(self):
+        """OSS上传器，第一次上传图片时才创建，没有图片的文档不会连接OSS"""
+        with self._uploader_lock:
+            if self._oss_uploader is None:
+                self._oss_uploader = OssImageUploader(encoding=self.image_encoding)
+            return self._oss_uploader
     
     def setup_pipeline_options(self):
         """设置文档处理管道选项"""
-        return PdfPipelineOptions(
+        from page_image_store import SpillingPdfPipelineOptions
+
+        # 页面图片写入落盘缓存，内存中只保留预算内的页面，文档处理完后删除
+        return SpillingPdfPipelineOptions(
             # 图片描述相关配置
             do_picture_description=True,
             picture_description_options=VlmConfiguration.get_local_options("qwen2.5vl:latest"),
@@ -259,35 +423,118 @@ class DocumentProcessor:
             #do_picture_classification=True,
         )
     
+    def pipeline_class(self):
+        """转换使用的流水线类：页面图片落盘缓存，图片描述并发请求并缓存"""
+        from picture_description import SpillingPictureDescriptionPdfPipeline
+
+        return SpillingPictureDescriptionPdfPipeline
+
     def convert_document(self):
-        """转换文档为内部表示"""
+        """转换文档为内部表示，源文件和流水线配置都未变化时直接读取缓存"""
         pipeline_options = self.setup_pipeline_options()
+        if self.document_cache is None:
+            return self._convert(pipeline_options)
+
+        with self.profiler.span("document_cache_load"):
+            cache_key = self.document_cache.key(self.config.doc_source, pipeline_options,
+                                                self.pipeline_class())
+            doc = self.document_cache.get(cache_key) if cache_key else None
+        if doc is not None:
+            return doc
+
+        doc = self._convert(pipeline_options)
+        if cache_key:
+            # 在上传图片、改写图片地址之前保存，缓存中是转换的原始结果
+            with self.profiler.span("document_cache_store"):
+                self.document_cache.put(cache_key, doc)
+        return doc
+
+    def _convert(self, pipeline_options):
+        """调用 docling 转换文档"""
+        if self.page_workers > 1:
+            # 各工作进程分别加载模型，docling 的分步计时留在工作进程中，不导入 profiler
+            from parallel_convert import convert_parallel
+
+            with self.profiler.span("docling_convert", page_workers=self.page_workers):
+                return convert_parallel(self.config.doc_source, pipeline_options,
+                                        pipeline_cls=self.pipeline_class(),
+                                        workers=self.page_workers)
         
-        converter = DocumentConverter(
-            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
-        )
-        
-        return converter.convert(source=self.config.doc_source).document
+        # 从注册表获取已初始化的转换器，相同配置不再重复加载模型
+        with self.profiler.span("load_models"):
+            converter = get_converter(pipeline_options, pipeline_cls=self.pipeline_class())
+
+        settings = None
+        if self.profiler.enabled:
+            # 让 docling 记录布局、OCR、表格、图片描述等各步骤的耗时；
+            # 这是进程级设置，转换结束后恢复，不影响同一进程中之后的转换
+            from docling.datamodel.settings import settings
+
+            previous_timings = settings.debug.profile_pipeline_timings
+            settings.debug.profile_pipeline_timings = True
+
+        try:
+            with self.profiler.span("docling_convert"):
+                conv_res = converter.convert(source=self.config.doc_source)
+        finally:
+            if settings is not None:
+                settings.debug.profile_pipeline_timings = previous_timings
+        self._unreleased_documents.append(conv_res.input.document_hash)
+        self.profiler.add_docling_timings(conv_res.timings)
+        return conv_res.document
     
+    def _upload_picture(self, item, img_count):
+        """编码并上传单张图片，返回URL或本地路径；无法生成hash时返回None"""
+        # 拿到识别的图片Data
+        img = item.image.pil_image
+
+        with self.profiler.span("picture", category="picture", ref=item.self_ref):
+            # 生成图片的hash值
+            hexhash = item._image_to_hexhash()
+            if hexhash is None:
+                return None
+            return self.oss_uploader.upload_image(img, hexhash, img_count)
+
     def process_images(self, doc):
-        """处理文档中的图片，上传到OSS或保存到本地"""
+        """处理文档中的图片，并发上传到OSS或保存到本地
+
+        所有图片的URI都设置完成后才返回，保证随后的序列化拿到的是最终地址。
+        返回前把本次新增的上传记录写回索引文件。
+        """
+        from docling_core.types.doc import PictureItem
+
         img_count = 0
-        for item, level in doc.iterate_items(with_groups=False):
-            if isinstance(item, PictureItem):
-                # 拿到识别的图片Data
-                img = item.image.pil_image
-
-                # 生成图片的hash值
-                hexhash = item._image_to_hexhash()
-                if hexhash is not None:
-                    uri = self.oss_uploader.upload_image(img, hexhash, img_count)
-                    item.image.uri = uri
-            img_count += 1
+        try:
+            with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+                futures = {}
+                for item, level in doc.iterate_items(with_groups=False):
+                    if isinstance(item, PictureItem) and item.image is not None:
+                        futures[executor.submit(self._upload_picture, item, img_count)] = item
+                    img_count += 1
+
+                for future in as_completed(futures):
+                    item = futures[future]
+                    try:
+                        uri = future.result()
+                    except Exception as e:
+                        self.oss_uploader.logger.error(f"处理图片 {item.self_ref} 时出错: {str(e)}")
+                        continue
+                    if uri is not None:
+                        item.image.uri = uri
+        finally:
+            if self._oss_uploader is not None:
+                self._oss_uploader.flush_index()
         
         return doc
     
-    def serialize_document(self, doc):
-        """序列化文档为Markdown格式"""
+    def create_serializer(self, doc):
+        """创建带自定义表格和图片序列化器的Markdown序列化器"""
+        from docling_core.transforms.chunker.hierarchical_chunker import TripletTableSerializer
+        from docling_core.transforms.serializer.markdown import MarkdownDocSerializer, MarkdownParams
+        from docling_core.types.doc.document import ImageRefMode
+
+        from annotation_serializer import AnnotationPictureSerializer
+
         serializer = MarkdownDocSerializer(
             doc=doc,
             table_serializer=TripletTableSerializer(),
@@ -302,33 +549,44 @@ class DocumentProcessor:
             ),
         )
         
-        return serializer.serialize()
+        return serializer
     
-    def save_markdown(self, ser_result):
-        """保存序列化结果到Markdown文件"""
-        # 确保输出目录存在
-        output_path = self.config.doc_dst
-        output_dir = Path(output_path).parent
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(ser_result.text)
-        
-        return output_path
+    def serialize_document(self, doc):
+        """序列化文档为Markdown格式，结果整体保存在内存中"""
+        return self.create_serializer(doc).serialize()
     
+    def save_markdown(self, doc):
+        """逐项序列化文档并写入Markdown文件，长文档也不会在内存中拼出整个文本"""
+        return write_markdown(self.create_serializer(doc), self.config.doc_dst)
+    
+    def release_page_images(self):
+        """删除已转换文档在落盘缓存中的页面图片，文档导出完成后调用
+
+        按转换时记录的文档哈希删除，与文档中是否还引用这些图片无关；
+        并行转换和读取转换缓存时页面图片不在本进程的缓存中，无需删除。
+        """
+        from page_image_store import release_page_images
+
+        while self._unreleased_documents:
+            release_page_images(self._unreleased_documents.pop())
+
     def process(self):
         """执行完整的文档处理流程"""
-        # 1. 转换文档
-        doc = self.convert_document()
-        
-        # 2. 处理图片
-        doc = self.process_images(doc)
-        
-        # 3. 序列化文档
-        ser_result = self.serialize_document(doc)
-        
-        # 4. 保存Markdown
-        output_path = self.save_markdown(ser_result)
+        with self.profiler.span("process", source=str(self.config.doc_source)):
+            # 1. 转换文档
+            with self.profiler.span("convert"):
+                doc = self.convert_document()
+            
+            try:
+                # 2. 处理图片
+                with self.profiler.span("process_images"):
+                    doc = self.process_images(doc)
+                
+                # 3. 序列化文档并保存Markdown，边序列化边写入
+                with self.profiler.span("serialize"):
+                    output_path = self.save_markdown(doc)
+            finally:
+                self.release_page_images()
         
         return output_path
 
@@ -342,11 +600,20 @@ def main():
     doc_alignment="Left"
     doc_width="700"
     show_description = False
+    profile = False  # 为 True 时记录各阶段耗时，并保存 Chrome trace 到输出文件旁边
+    page_workers = 1  # 大文档可设为 CPU 核数，按页码区间并行转换
+    doc_cache_dir = "./output/.doc_cache"  # 转换结果缓存目录，None 表示不缓存
 
     config = ConfigManager(doc_source, doc_dst, doc_alignment, doc_width, show_description)
     
+    # 图片编码配置，例如 ImageEncodingOptions(format="WEBP", quality=80, max_dimension=1600)
+    image_encoding = ImageEncodingOptions()
+
     # 创建文档处理器
-    processor = DocumentProcessor(config)
+    profiler = StageProfiler(enabled=profile)
+    processor = DocumentProcessor(config, image_encoding=image_encoding, profiler=profiler,
+                                  page_workers=page_workers,
+                                  document_cache=DocumentCache(doc_cache_dir) if doc_cache_dir else None)
     
     # 处理文档
     output_path = processor.process()
@@ -355,6 +622,13 @@ def main():
     printer = ConsolePrinter()
     printer.print_panel(f"文档处理完成，输出文件：{output_path}")
 
+    if profile:
+        trace_path = profiler.save_chrome_trace(Path(output_path).with_suffix(".trace.json"))
+        lines = [f"{name}: {s['count']} 次, {s['wall_s']:.2f}s, CPU {s['cpu_s']:.2f}s"
+                 for name, s in profiler.summary().items()]
+        lines.append(f"Chrome trace: {trace_path}")
+        printer.print_panel("\n".join(lines))
+
 
 if __name__ == "__main__":
     main()
@@ -5,9 +5,10 @@ from pathlib import Path
 from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
 
 from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.document_converter import DocumentConverter, PdfFormatOption
 
+from page_image_store import SpillingPdfPipeline, SpillingPdfPipelineOptions
+
 _log = logging.getLogger(__name__)
 
 IMAGE_RESOLUTION_SCALE = 2.0
@@ -25,14 +26,17 @@ def main():
     # scale=1 correspond of a standard 72 DPI image
     # The PdfPipelineOptions.generate_* are the selectors for the document elements which will be enriched
     # with the image field
-    pipeline_options = PdfPipelineOptions()
+    # 页面图片写入磁盘缓存，内存中最多保留 page_ram_budget_mb 的页面，长文档不会因此耗尽内存
+    pipeline_options = SpillingPdfPipelineOptions(page_ram_budget_mb=256)
     pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
     pipeline_options.generate_page_images = True
     pipeline_options.generate_picture_images = True
 
     doc_converter = DocumentConverter(
         format_options={
-            InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+            InputFormat.PDF: PdfFormatOption(
+                pipeline_options=pipeline_options, pipeline_cls=SpillingPdfPipeline
+            )
         }
     )
 
@@ -1,18 +1,11 @@
 import logging
 import os
 from pathlib import Path
-import litellm
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import (
-    ApiVlmOptions,
-    ResponseFormat,
-    VlmPipelineOptions,
-)
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.pipeline.vlm_pipeline import VlmPipeline
-import threading
-import queue
+from converter_registry import get_converter, options_hash
+from conversion_manifest import ConversionManifest
+from gemini_api_server import GeminiAPIServer, gemini_vlm_options
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # 加载环境变量
 from dotenv import load_dotenv
@@ -21,126 +14,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-# 创建一个自定义的 API 服务器模拟器
-class GeminiAPIServer:
-    def __init__(self):
-        self.is_running = False
-        self.server_thread = None
-        self.model_cache = {}
-
-    def start(self):
-        """启动 API 服务器"""
-        import http.server
-        import socketserver
-        import json
-        from urllib.parse import parse_qs, urlparse
-
-        class CustomHandler(http.server.SimpleHTTPRequestHandler):
-            server_obj = self
-
-            def do_POST(self):
-                if self.path == '/v1/chat/completions':
-                    content_length = int(self.headers['Content-Length'])
-                    post_data = self.rfile.read(content_length)
-
-                    try:
-                        request_data = json.loads(post_data.decode('utf-8'))
-                        response = self.handle_completion(request_data)
-
-                        self.send_response(200)
-                        self.send_header('Content-type', 'application/json')
-                        self.end_headers()
-                        self.wfile.write(json.dumps(response).encode())
-                    except Exception as e:
-                        self.send_response(500)
-                        self.send_header('Content-type', 'application/json')
-                        self.end_headers()
-                        error_response = {"error": str(e)}
-                        self.wfile.write(json.dumps(error_response).encode())
-                else:
-                    self.send_response(404)
-                    self.end_headers()
-
-            def handle_completion(self, request_data):
-                model = request_data.get("model", "gemini-2.5-pro-preview-05-06")
-                messages = request_data.get("messages", [])
-
-                # 使用 liteLLM 进行实际调用
-                try:
-                    response = litellm.completion(
-                        model=f"gemini/{model}",
-                        messages=messages,
-                        temperature=request_data.get("temperature", 0.1),
-                        max_tokens=request_data.get("max_tokens", 65536)
-                    )
-
-                    # 确保响应格式符合 OpenAI 标准
-                    return {
-                        "id": response.id,
-                        "object": "chat.completion",
-                        "created": int(time.time()),
-                        "model": model,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "message": {
-                                    "role": "assistant",
-                                    "content": response.choices[0].message.content
-                                },
-                                "finish_reason": "stop"
-                            }
-                        ],
-                        "usage": response.usage.dict() if response.usage else {}
-                    }
-                except Exception as e:
-                    raise e
-
-            def log_message(self, format, *args):
-                pass  # 减少日志输出
-
-        def run_server():
-            with socketserver.TCPServer(("", 4000), CustomHandler) as httpd:
-                httpd.timeout = 1  # 设置超时，便于优雅关闭
-                self.httpd = httpd
-                while self.is_running:
-                    httpd.handle_request()
-
-        self.is_running = True
-        self.server_thread = threading.Thread(target=run_server)
-        self.server_thread.start()
-        time.sleep(2)  # 等待服务器启动
-
-    def stop(self):
-        """停止 API 服务器"""
-        self.is_running = False
-        if self.server_thread:
-            self.server_thread.join(timeout=5)
-        logging.info("API 服务器已停止")
-
 # 全局 API 服务器实例
 api_server = GeminiAPIServer()
 
-def gemini_vlm_options(model: str, prompt: str, timeout: int = 300):
-    """配置 Gemini 的 VLM 选项"""
-    options = ApiVlmOptions(
-        url="http://localhost:4000/v1/chat/completions",
-        params=dict(
-            model=model,
-            max_tokens=65536,
-            temperature=1,
-        ),
-        prompt=prompt,
-        timeout=timeout,
-        scale=1.0, # 图片缩放比例
-        response_format=ResponseFormat.MARKDOWN,
-    )
-    return options
+def build_pipeline_options(model_name: str, api_port: int = 4000):
+    """构建VLM流水线配置"""
+    from docling.datamodel.pipeline_options import VlmPipelineOptions
 
-def process_single_pdf(pdf_path: Path, output_dir: Path, model_name: str = "gemini-2.5-pro-preview-05-06"):
-    """处理单个PDF文件"""
-    logging.info(f"正在处理: {pdf_path.name}")
-
-    # 配置VLM流水线
     pipeline_options = VlmPipelineOptions(
         enable_remote_services=True
     )
@@ -148,26 +28,35 @@ def process_single_pdf(pdf_path: Path, output_dir: Path, model_name: str = "gemi
     pipeline_options.vlm_options = gemini_vlm_options(
         model=model_name,
         prompt="OCR the full page to markdown.",
-        timeout=300
+        timeout=300,
+        api_port=api_port,
     )
+    return pipeline_options
 
-    # 创建文档转换器
-    doc_converter = DocumentConverter(
-        format_options={
-            InputFormat.PDF: PdfFormatOption(
-                pipeline_options=pipeline_options,
-                pipeline_cls=VlmPipeline,
-            )
-        }
-    )
+def output_file_for(pdf_path: Path, output_dir: Path) -> Path:
+    """PDF 对应的 Markdown 输出路径"""
+    return output_dir / f"{pdf_path.stem}_content.md"
+
+def process_single_pdf(pdf_path: Path, output_dir: Path, model_name: str = "gemini-2.5-pro-preview-05-06",
+                       api_port: int = 4000):
+    """处理单个PDF文件"""
+    logging.info(f"正在处理: {pdf_path.name}")
+
+    # 配置VLM流水线
+    pipeline_options = build_pipeline_options(model_name, api_port)
 
     try:
+        from docling.pipeline.vlm_pipeline import VlmPipeline
+
+        # 从注册表获取已初始化的转换器，相同配置不再重复创建
+        doc_converter = get_converter(pipeline_options, pipeline_cls=VlmPipeline)
+
         # 执行转换
         result = doc_converter.convert(pdf_path)
 
         # 保存结果
         markdown_content = result.document.export_to_markdown()
-        output_file = output_dir / f"{pdf_path.stem}_content.md"
+        output_file = output_file_for(pdf_path, output_dir)
 
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write(markdown_content)
@@ -179,28 +68,60 @@ def process_single_pdf(pdf_path: Path, output_dir: Path, model_name: str = "gemi
         logging.error(f"处理 {pdf_path.name} 时出错: {e}")
         return False, None
 
-def process_pdf_folder(input_folder: str, output_folder: str = "./output", model_name: str = "gemini-2.5-pro-preview-05-06"):
-    """处理指定文件夹中的所有PDF文件"""
-
-    # 设置日志
+def _init_worker():
+    """工作进程初始化：配置日志，转换器由进程内的注册表各自缓存"""
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-    # 检查环境变量
-    if not os.getenv("GEMINI_API_KEY"):
-        logging.error("未设置 GEMINI_API_KEY 环境变量")
-        logging.error("请设置你的 Gemini API 密钥: export GEMINI_API_KEY='your-api-key'")
+def _convert_files(pdf_files, output_path: Path, model_name: str, workers: int, api_port: int):
+    """转换文件列表，按完成顺序返回 (pdf_file, success, output_file)"""
+    if workers <= 1:
+        for i, pdf_file in enumerate(pdf_files, 1):
+            logging.info(f"\n=== 处理第 {i}/{len(pdf_files)} 个文件 ===")
+            success, output_file = process_single_pdf(pdf_file, output_path, model_name, api_port)
+            yield pdf_file, success, output_file
         return
 
-    # 初始化 liteLLM
-    os.environ["LITELLM_LOG"] = "ERROR"  # 减少日志输出
+    # 每个工作进程保留自己的转换器，所有进程共用父进程启动的 API 服务器
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(process_single_pdf, pdf_file, output_path, model_name, api_port): pdf_file
+            for pdf_file in pdf_files
+        }
+        for future in as_completed(futures):
+            pdf_file = futures[future]
+            try:
+                success, output_file = future.result()
+            except Exception as e:
+                # 工作进程异常退出等情况
+                logging.error(f"处理 {pdf_file.name} 时工作进程出错: {e}")
+                success, output_file = False, None
+            yield pdf_file, success, output_file
+
+def _pending_files(pdf_files, output_path: Path, manifest: ConversionManifest, options_key: str):
+    """筛选出内容或配置有变化、需要重新转换的文件，返回 [(pdf_file, content_hash)]"""
+    pending = []
+    for pdf_file in pdf_files:
+        content_hash = manifest.content_hash(pdf_file)
+        if manifest.is_current(content_hash, options_key, output_file_for(pdf_file, output_path)):
+            logging.info(f"跳过未变化的文件: {pdf_file.name}")
+        else:
+            pending.append((pdf_file, content_hash))
+    manifest.save()  # 保存新计算的文件哈希
+    return pending
+
+def process_pdf_folder(input_folder: str, output_folder: str = "./output", model_name: str = "gemini-2.5-pro-preview-05-06",
+                       workers: int = 1, api_port: int = 4000, skip_unchanged: bool = True):
+    """处理指定文件夹中的所有PDF文件
+
+    workers 大于 1 时使用多进程并行转换；api_port 为 0 时由系统分配空闲端口。
+    skip_unchanged 为 True 时，根据输出目录中的转换清单跳过内容和配置都未变化的文件。
+    """
 
-    # 启动本地 API 服务器
-    logging.info("=== 启动本地 API 服务器 ===")
-    try:
-        api_server.start()
-        logging.info("API 服务器启动成功")
-    except Exception as e:
-        logging.error(f"无法启动 API 服务器: {e}")
+    # 设置日志
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # 检查环境变量并启动本地 API 服务器
+    if not _start_api_server(api_port):
         return
 
     # 检查输入文件夹
@@ -223,16 +144,33 @@ def process_pdf_folder(input_folder: str, output_folder: str = "./output", model
 
         logging.info(f"找到 {len(pdf_files)} 个PDF文件")
 
+        # 配置哈希只取决于模型和提示词等，与代理端口无关，因此按默认端口计算
+        from docling.pipeline.vlm_pipeline import VlmPipeline
+
+        manifest = ConversionManifest(output_path)
+        options_key = options_hash(build_pipeline_options(model_name), VlmPipeline)
+        if skip_unchanged:
+            pending = _pending_files(pdf_files, output_path, manifest, options_key)
+        else:
+            pending = [(pdf_file, manifest.content_hash(pdf_file)) for pdf_file in pdf_files]
+        content_hashes = dict(pending)
+        skipped_count = len(pdf_files) - len(pending)
+
         # 处理每个PDF文件
         success_count = 0
         failed_files = []
 
-        for i, pdf_file in enumerate(pdf_files, 1):
-            logging.info(f"\n=== 处理第 {i}/{len(pdf_files)} 个文件 ===")
-            success, output_file = process_single_pdf(pdf_file, output_path, model_name)
+        workers = max(1, min(workers, len(pending)))
+        if pending:
+            logging.info(f"需要转换 {len(pending)} 个文件，使用 {workers} 个工作进程")
 
+        for pdf_file, success, output_file in _convert_files(
+            list(content_hashes), output_path, model_name, workers, api_server.port
+        ):
             if success:
                 success_count += 1
+                manifest.record(pdf_file, content_hashes[pdf_file], options_key, output_file)
+                manifest.save()
                 # 显示部分内容预览
                 with open(output_file, 'r', encoding='utf-8') as f:
                     content = f.read()
@@ -243,12 +181,147 @@ def process_pdf_folder(input_folder: str, output_folder: str = "./output", model
 
         # 输出处理结果统计
         logging.info(f"\n=== 处理完成 ===")
-        logging.info(f"成功处理: {success_count}/{len(pdf_files)} 个文件")
+        logging.info(f"成功处理: {success_count}/{len(pending)} 个文件，跳过未变化的文件: {skipped_count} 个")
         if failed_files:
             logging.warning(f"失败文件: {', '.join(failed_files)}")
 
     finally:
-        # 停止服务器
+        # 输出代理指标并停止服务器
+        logging.info(f"API 服务器指标: {api_server.metrics.snapshot()}")
+        api_server.stop()
+
+class FolderWatcher:
+    """轮询输入文件夹，找出写入已完成的新增或修改的PDF
+
+    文件大小和修改时间在 settle_seconds 内保持不变才视为写入完成，
+    每个文件的同一版本只返回一次。
+    """
+    def __init__(self, input_path: Path, settle_seconds: float = 3.0):
+        self.input_path = input_path
+        self.settle_seconds = settle_seconds
+        self._seen = {}  # pdf_file -> (签名, 签名首次出现的时间, 是否已返回)
+
+    def poll(self):
+        """扫描一次文件夹，返回本次新就绪的文件列表"""
+        now = time.monotonic()
+        ready = []
+        current = set()
+        for pdf_file in self.input_path.glob("*.pdf"):
+            try:
+                st = pdf_file.stat()
+            except FileNotFoundError:
+                continue  # 扫描期间被删除或改名
+            current.add(pdf_file)
+            signature = (st.st_size, st.st_mtime_ns)
+            previous = self._seen.get(pdf_file)
+            if previous is None or previous[0] != signature:
+                self._seen[pdf_file] = (signature, now, False)
+            elif not previous[2] and now - previous[1] >= self.settle_seconds:
+                self._seen[pdf_file] = (signature, previous[1], True)
+                ready.append(pdf_file)
+
+        for removed in set(self._seen) - current:
+            del self._seen[removed]
+        return ready
+
+def _start_api_server(api_port: int) -> bool:
+    """检查环境变量并启动本地 API 服务器"""
+    if not os.getenv("GEMINI_API_KEY"):
+        logging.error("未设置 GEMINI_API_KEY 环境变量")
+        logging.error("请设置你的 Gemini API 密钥: export GEMINI_API_KEY='your-api-key'")
+        return False
+
+    # 初始化 liteLLM
+    os.environ["LITELLM_LOG"] = "ERROR"  # 减少日志输出
+
+    logging.info("=== 启动本地 API 服务器 ===")
+    try:
+        api_server.port = api_port
+        api_server.start()
+        logging.info(f"API 服务器启动成功，端口: {api_server.port}")
+        return True
+    except Exception as e:
+        logging.error(f"无法启动 API 服务器: {e}")
+        return False
+
+def watch_pdf_folder(input_folder: str, output_folder: str = "./output", model_name: str = "gemini-2.5-pro-preview-05-06",
+                     workers: int = 1, api_port: int = 4000, poll_interval: float = 2.0, settle_seconds: float = 3.0):
+    """持续监听文件夹，新增或修改的PDF写入完成后自动转换
+
+    转换器和 API 服务器在整个运行期间保持加载，按 Ctrl+C 停止。
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    input_path = Path(input_folder)
+    if not input_path.exists():
+        logging.error(f"输入文件夹不存在: {input_folder}")
+        return
+
+    output_path = Path(output_folder)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    if not _start_api_server(api_port):
+        return
+
+    from docling.pipeline.vlm_pipeline import VlmPipeline
+
+    manifest = ConversionManifest(output_path)
+    options_key = options_hash(build_pipeline_options(model_name), VlmPipeline)
+    watcher = FolderWatcher(input_path, settle_seconds)
+
+    # 单进程时用一个后台线程转换，主线程继续扫描文件夹
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    else:
+        executor = ThreadPoolExecutor(max_workers=1)
+
+    in_flight = {}  # pdf_file -> (future, content_hash)
+    deferred = set()  # 转换期间又被修改、完成后需要重新检查的文件
+
+    def submit_if_changed(pdf_file):
+        if pdf_file in in_flight:
+            deferred.add(pdf_file)
+            return
+        try:
+            content_hash = manifest.content_hash(pdf_file)
+        except FileNotFoundError:
+            return
+        if manifest.is_current(content_hash, options_key, output_file_for(pdf_file, output_path)):
+            return
+        logging.info(f"检测到新增或修改的文件，加入转换队列: {pdf_file.name}")
+        future = executor.submit(process_single_pdf, pdf_file, output_path, model_name, api_server.port)
+        in_flight[pdf_file] = (future, content_hash)
+
+    logging.info(f"开始监听文件夹: {input_path}（按 Ctrl+C 停止）")
+    try:
+        while True:
+            for pdf_file in watcher.poll():
+                submit_if_changed(pdf_file)
+
+            for pdf_file, (future, content_hash) in list(in_flight.items()):
+                if not future.done():
+                    continue
+                del in_flight[pdf_file]
+                try:
+                    success, output_file = future.result()
+                except Exception as e:
+                    logging.error(f"处理 {pdf_file.name} 时工作进程出错: {e}")
+                    success, output_file = False, None
+                if success:
+                    manifest.record(pdf_file, content_hash, options_key, output_file)
+                    manifest.save()
+                else:
+                    logging.warning(f"转换失败，文件再次修改后将重试: {pdf_file.name}")
+                if pdf_file in deferred:
+                    deferred.discard(pdf_file)
+                    submit_if_changed(pdf_file)
+
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        logging.info("收到中断信号，停止监听")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        logging.info(f"API 服务器指标: {api_server.metrics.snapshot()}")
         api_server.stop()
 
 def main():
@@ -262,8 +335,17 @@ def main():
     # 设置模型名称
     model_name = "gemini-2.5-pro-preview-05-06"  # 使用 Gemini 2.5 Pro Preview
 
-    # 处理指定文件夹中的所有PDF
-    process_pdf_folder(input_folder, output_folder, model_name)
+    # 并行工作进程数，1 表示逐个处理
+    workers = 1
+
+    # 是否持续监听文件夹，新文件写入后自动转换
+    watch = False
+
+    if watch:
+        watch_pdf_folder(input_folder, output_folder, model_name, workers=workers)
+    else:
+        # 处理指定文件夹中的所有PDF
+        process_pdf_folder(input_folder, output_folder, model_name, workers=workers)
 
 if __name__ == "__main__":
     main()
@@ -11,6 +11,9 @@ from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.datamodel.pipeline_options import VlmPipelineOptions
 from docling.datamodel.base_models import InputFormat
 from docling.pipeline.vlm_pipeline import VlmPipeline  
+from docling_core.transforms.serializer.markdown import MarkdownDocSerializer, MarkdownParams
+
+from markdown_stream import write_markdown
 
 def ollama_vlm_options(model: str, prompt: str):
     options = ApiVlmOptions(
@@ -58,18 +61,18 @@ def main():
             InputFormat.PDF: PdfFormatOption(  
                 pipeline_options=pipeline_options,  
                 pipeline_cls=VlmPipeline
-            )  
+            )
         }  
     )  
   
     doc = converter.convert(input_doc).document  
       
-    # 使用EMBEDDED模式导出Markdown  
-    markdown_text = doc.export_to_markdown(image_mode=ImageRefMode.EMBEDDED)  
-  
-    # 保存到本地Markdown文件  
-    with open(output_path, "w", encoding="utf-8") as f:  
-        f.write(markdown_text)  
+    # 使用EMBEDDED模式导出Markdown，逐项写入文件，内嵌的图片数据不会在内存中拼成一个大字符串
+    serializer = MarkdownDocSerializer(
+        doc=doc,
+        params=MarkdownParams(image_mode=ImageRefMode.EMBEDDED),
+    )  
+    write_markdown(serializer, output_path)
       
     print(f"文档已成功转换并保存到 {output_path}")  
   
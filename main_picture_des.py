@@ -5,9 +5,11 @@ from pathlib import Path
 from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
 
 from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, PictureDescriptionApiOptions
+from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.document_converter import DocumentConverter, PdfFormatOption
 
+from picture_description import CachedPictureDescriptionApiOptions, PictureDescriptionPdfPipeline
+
 
 _log = logging.getLogger(__name__)
 
@@ -16,7 +18,8 @@ IMAGE_RESOLUTION_SCALE = 2.0
 
 
 def vllm_local_options(model: str):
-    options = PictureDescriptionApiOptions(
+    # 同时发出 4 个描述请求，结果按图片内容缓存，重复转换时不再请求
+    options = CachedPictureDescriptionApiOptions(
         url="http://localhost:11434/v1/chat/completions",
         params=dict(
             model=model,
@@ -25,6 +28,7 @@ def vllm_local_options(model: str):
         ),
         prompt="Describe the image in three sentences. Be consise and accurate.",
         timeout=90,
+        concurrency=4,
     )
     return options
 
@@ -50,7 +54,10 @@ def main():
 
     doc_converter = DocumentConverter(
         format_options={
-            InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+            InputFormat.PDF: PdfFormatOption(
+                pipeline_options=pipeline_options,
+                pipeline_cls=PictureDescriptionPdfPipeline,
+            )
         }
     )
 
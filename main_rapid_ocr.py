@@ -1,10 +1,10 @@
-import os
 from typing import List
 from pathlib import Path
 
-from huggingface_hub import snapshot_download
+from model_resolver import resolve_rapidocr_models
+from page_image_store import SpillingPdfPipeline, SpillingPdfPipelineOptions
 
-from docling.datamodel.pipeline_options import PdfPipelineOptions, RapidOcrOptions
+from docling.datamodel.pipeline_options import RapidOcrOptions
 from docling.document_converter import (
     ConversionResult,
     DocumentConverter,
@@ -23,9 +23,8 @@ def main():
     input_doc_path = Path("./test3/2025-05-20.pdf")
     output_dir = Path("output")
 
-    # Download RappidOCR models from HuggingFace
-    print("Downloading RapidOCR models")
-    download_path = snapshot_download(repo_id="SWHL/RapidOCR")
+    # Resolve RapidOCR models (downloaded from HuggingFace only when not verified locally)
+    print("Resolving RapidOCR models")
 
     # Setup RapidOcrOptions for english detection
     # det_model_path = os.path.join(
@@ -38,10 +37,8 @@ def main():
     #     download_path, "PP-OCRv3", "ch_ppocr_mobile_v2.0_cls_train.onnx"
     # )
 
-    # 中文检测和识别
-    det_model_path = os.path.join(download_path, "PP-OCRv4", "ch_PP-OCRv4_det_infer.onnx")      # 检测模型
-    rec_model_path = os.path.join(download_path, "PP-OCRv4", "ch_PP-OCRv4_rec_server_infer.onnx") # 中文识别
-    cls_model_path = os.path.join(download_path, "PP-OCRv3", "ch_ppocr_mobile_v2.0_cls_train.onnx") # 方向分类
+    # 中文检测和识别：检测模型、中文识别、方向分类
+    det_model_path, rec_model_path, cls_model_path = resolve_rapidocr_models()
     
     lang: List[str] = ['english', 'chinese']
 
@@ -52,12 +49,14 @@ def main():
         lang=lang,
     )
 
-    pipeline_options = PdfPipelineOptions(
-        ocr_options=ocr_options        
+    # 页面图片写入磁盘缓存，内存中最多保留 page_ram_budget_mb 的页面
+    pipeline_options = SpillingPdfPipelineOptions(
+        ocr_options=ocr_options,
         # do_ocr=True,   
         generate_page_images=True,  # 生成页面图片  
         generate_picture_images=True,  # 生成图片元素的图片  
-        images_scale=2  # 提高图片质量  
+        images_scale=2,  # 提高图片质量  
+        page_ram_budget_mb=256,
     )
 
     start_time = time.time()
@@ -67,6 +66,7 @@ def main():
         format_options={
             InputFormat.PDF: PdfFormatOption(
                 pipeline_options=pipeline_options,
+                pipeline_cls=SpillingPdfPipeline,
             ),
         },
     )
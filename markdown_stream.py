@@ -0,0 +1,51 @@
+import os
+from pathlib import Path
+
+
+def iter_markdown_parts(serializer):
+    """逐项生成文档序列化后的 Markdown 片段
+
+    与 MarkdownDocSerializer.serialize() 遍历顶层条目的方式相同（参见 get_parts），
+    自定义的表格/图片序列化器照常生效，但不会把所有片段收集到一个列表里。
+    """
+    # _iterate_items 是 docling_core 内部函数，get_parts 也用它遍历文档并插入分页标记
+    from docling_core.transforms.serializer.common import _iterate_items
+
+    params = serializer.params
+    page_break = serializer.requires_page_break()
+    visited = set()
+    for node in _iterate_items(doc=serializer.doc, layers=params.layers, add_page_breaks=page_break):
+        if node.self_ref in visited:
+            continue
+        visited.add(node.self_ref)
+        text = serializer.serialize(item=node, visited=visited).text
+        if not text:
+            continue
+        if page_break:
+            # 与 serialize_doc 一致，把分页标记替换为配置的占位符
+            for full_match, _, _ in serializer._get_page_breaks(text=text):
+                text = text.replace(full_match, params.page_break_placeholder or "")
+        yield text
+
+
+def write_markdown(serializer, output_path):
+    """把序列化结果逐项写入文件，峰值内存与文档大小无关
+
+    各片段之间用空行分隔，输出与 serializer.serialize().text 相同。
+    先写临时文件再原子替换，中途出错时不会留下不完整的输出。
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            separator = ""
+            for text in iter_markdown_parts(serializer):
+                f.write(separator)
+                f.write(text)
+                separator = "\n\n"
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return output_path
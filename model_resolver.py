@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+_log = logging.getLogger(__name__)
+
+RAPIDOCR_REPO_ID = "SWHL/RapidOCR"
+
+# RapidOCR 使用的模型文件（相对于仓库根目录）
+RAPIDOCR_FILES = {
+    "det": "PP-OCRv4/ch_PP-OCRv4_det_infer.onnx",            # 检测模型
+    "rec": "PP-OCRv4/ch_PP-OCRv4_rec_server_infer.onnx",     # 中文识别
+    "cls": "PP-OCRv3/ch_ppocr_mobile_v2.0_cls_train.onnx",   # 方向分类
+}
+
+DEFAULT_MANIFEST_PATH = Path.home() / ".cache" / "docling-test" / "model_manifest.json"
+
+
+def _sha256(path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelArtifactResolver:
+    """解析模型文件的本地路径，优先使用已校验的本地清单
+
+    清单记录每个文件的路径、sha256、大小和修改时间。大小和修改时间都未变时直接信任，
+    否则重新计算 sha256 校验。清单不可用时依次尝试本地 Hugging Face 缓存和联网下载；
+    offline 为 True（或设置了 HF_HUB_OFFLINE）时不会联网。
+    清单中已记录的 sha256 只在第一次下载时写入：之后本地文件与之不符时强制重新下载，
+    下载结果仍不符则报错，不会用校验失败的文件更新清单。
+    """
+    def __init__(self, repo_id, files, manifest_path=DEFAULT_MANIFEST_PATH, offline=None):
+        self.repo_id = repo_id
+        self.files = files
+        self.manifest_path = Path(manifest_path)
+        if offline is None:
+            offline = os.getenv("HF_HUB_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _verify(entry) -> bool:
+        """校验清单条目对应的文件，必要时更新条目中的大小和修改时间"""
+        try:
+            st = os.stat(entry["path"])
+        except OSError:
+            return False
+        if st.st_size == entry.get("size") and st.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+        if st.st_size != entry.get("size") or _sha256(entry["path"]) != entry["sha256"]:
+            return False
+        entry["mtime_ns"] = st.st_mtime_ns
+        return True
+
+    @staticmethod
+    def _make_entry(path, sha256):
+        st = os.stat(path)
+        return dict(path=str(path), sha256=sha256, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+    def _check(self, download_path, pinned):
+        """计算快照中各文件的 sha256，返回 {相对路径: sha256}
+
+        有文件缺失，或与 pinned 中已记录的 sha256 不符时返回 None。
+        """
+        hashes = {}
+        for rel in self.files.values():
+            path = os.path.join(download_path, rel)
+            if not os.path.exists(path):
+                return None
+            hashes[rel] = _sha256(path)
+            if rel in pinned and hashes[rel] != pinned[rel]:
+                _log.warning(f"模型文件与清单中的 sha256 不一致: {path}")
+                return None
+        return hashes
+
+    def _snapshot(self, local_files_only, force_download=False):
+        from huggingface_hub import snapshot_download
+
+        return snapshot_download(
+            repo_id=self.repo_id,
+            allow_patterns=list(self.files.values()),
+            local_files_only=local_files_only,
+            force_download=force_download,
+        )
+
+    def resolve(self):
+        """返回 {名称: 本地路径}"""
+        manifest = self._load_manifest()
+        entries = manifest.setdefault(self.repo_id, {})
+        before = json.dumps(entries, sort_keys=True)
+
+        if all(rel in entries and self._verify(entries[rel]) for rel in self.files.values()):
+            if json.dumps(entries, sort_keys=True) != before:
+                self._save_manifest(manifest)  # 文件被 touch 过但内容未变，更新修改时间
+            return {name: entries[rel]["path"] for name, rel in self.files.items()}
+
+        # 清单缺失或校验失败：先查本地缓存，必要时再联网下载，结果必须与已记录的 sha256 一致
+        pinned = {rel: entries[rel]["sha256"] for rel in self.files.values() if rel in entries}
+        download_path = None
+        hashes = None
+        try:
+            download_path = self._snapshot(local_files_only=True)
+            hashes = self._check(download_path, pinned)
+        except Exception:
+            pass
+        if hashes is None:
+            if self.offline:
+                raise FileNotFoundError(f"离线模式下本地没有可用（且校验通过）的模型文件: {self.repo_id}")
+            # 本地缓存中已有文件但校验不通过时，强制重新下载而不是复用损坏的文件
+            force_download = download_path is not None
+            _log.info(f"从 Hugging Face 下载模型: {self.repo_id}（force_download={force_download}）")
+            download_path = self._snapshot(local_files_only=False, force_download=force_download)
+            hashes = self._check(download_path, pinned)
+            if hashes is None:
+                raise ValueError(
+                    f"下载的模型文件与清单 {self.manifest_path} 中记录的 sha256 不一致: {self.repo_id}，"
+                    f"如确认模型已更新，请删除清单中的对应条目后重试"
+                )
+
+        for rel in self.files.values():
+            entries[rel] = self._make_entry(os.path.join(download_path, rel), hashes[rel])
+        self._save_manifest(manifest)
+        return {name: entries[rel]["path"] for name, rel in self.files.items()}
+
+
+def resolve_rapidocr_models(manifest_path=DEFAULT_MANIFEST_PATH, offline=None):
+    """返回 RapidOCR 的 (检测, 识别, 方向分类) 模型路径"""
+    paths = ModelArtifactResolver(RAPIDOCR_REPO_ID, RAPIDOCR_FILES, manifest_path, offline).resolve()
+    return paths["det"], paths["rec"], paths["cls"]
@@ -0,0 +1,142 @@
+import json
+import os
+from pathlib import Path
+
+EXPORT_FORMATS = ("json", "text", "markdown", "doctags")
+_EXTENSIONS = dict(json="json", text="txt", markdown="md", doctags="doctags")
+
+
+class _StreamWriter:
+    """把一个文档序列化器的输出逐项写入文件
+
+    与 serialize_doc 的拼接方式一致：片段之间用 delim 分隔，前后加 header/footer，
+    需要分页时把分页标记替换为 page_sep。每个写入器维护自己的 visited 集合。
+    """
+    def __init__(self, serializer, fp, delim="\n\n", header="", footer="", page_sep=""):
+        self.serializer = serializer
+        self.fp = fp
+        self.delim = delim
+        self.footer = footer
+        self.page_sep = page_sep
+        self.page_break = serializer.requires_page_break()
+        self.visited = set()
+        self._first = True
+        fp.write(header)
+
+    def feed(self, node, is_page_break):
+        if is_page_break and not self.page_break:
+            return
+        if node.self_ref in self.visited:
+            return
+        self.visited.add(node.self_ref)
+        text = self.serializer.serialize(item=node, visited=self.visited).text
+        if not text:
+            return
+        if self.page_break:
+            for full_match, _, _ in self.serializer._get_page_breaks(text=text):
+                text = text.replace(full_match, self.page_sep)
+        if not self._first:
+            self.fp.write(self.delim)
+        self.fp.write(text)
+        self._first = False
+
+    def close(self):
+        self.fp.write(self.footer)
+
+
+def _create_writer(fmt, doc, fp):
+    """创建与 DoclingDocument.export_to_* 默认参数一致的写入器"""
+    if fmt == "markdown":
+        from docling_core.transforms.serializer.markdown import MarkdownDocSerializer, MarkdownParams
+
+        return _StreamWriter(MarkdownDocSerializer(doc=doc, params=MarkdownParams()), fp)
+    if fmt == "text":
+        # export_to_text 等价于不转义下划线、不输出图片占位符的 Markdown
+        from docling_core.transforms.serializer.markdown import MarkdownDocSerializer, MarkdownParams
+
+        params = MarkdownParams(escape_underscores=False, image_placeholder="")
+        return _StreamWriter(MarkdownDocSerializer(doc=doc, params=params), fp)
+    if fmt == "doctags":
+        from docling_core.transforms.serializer.doctags import DocTagsDocSerializer, DocTagsParams
+        from docling_core.types.doc.tokens import DocumentToken
+
+        params = DocTagsParams()
+        delim = "\n" if params.mode == DocTagsParams.Mode.HUMAN_FRIENDLY else ""
+        tag = DocumentToken.DOCUMENT.value
+        return _StreamWriter(
+            DocTagsDocSerializer(doc=doc, params=params), fp,
+            delim=delim, header=f"<{tag}>", footer=f"{delim}</{tag}>",
+            page_sep=f"<{DocumentToken.PAGE_BREAK.value}>",
+        )
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def _write_json(doc, fp, chunk_size=1 << 16):
+    """把文档 JSON 分块写入文件，不在内存中生成完整的 JSON 字符串
+
+    输出与 json.dumps(doc.export_to_dict()) 相同。
+    """
+    buffer = []
+    size = 0
+    for chunk in json.JSONEncoder().iterencode(doc.export_to_dict()):
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            fp.write("".join(buffer))
+            buffer.clear()
+            size = 0
+    fp.write("".join(buffer))
+
+
+def export_document(doc, output_dir, stem, formats=EXPORT_FORMATS):
+    """一次遍历文档，同时导出多种格式，返回 {格式: 文件路径}
+
+    Markdown、纯文本和 DocTags 共用一次顶层条目遍历，每个条目依次交给各格式的
+    序列化器并立即写入对应文件；JSON 由 export_to_dict() 的结果流式编码写入。
+    各格式的输出与 export_to_markdown / export_to_text / export_to_doctags /
+    json.dumps(export_to_dict()) 相同。文件先写到临时文件，全部成功后再替换。
+    """
+    from docling_core.transforms.serializer.common import _iterate_items, _PageBreakNode
+
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"不支持的导出格式: {', '.join(sorted(unknown))}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = {fmt: output_dir / f"{stem}.{_EXTENSIONS[fmt]}" for fmt in formats}
+    tmp_paths = {fmt: path.with_suffix(path.suffix + ".tmp") for fmt, path in paths.items()}
+
+    files = {}
+    try:
+        try:
+            for fmt in formats:
+                files[fmt] = open(tmp_paths[fmt], "w", encoding="utf-8")
+
+            if "json" in files:
+                _write_json(doc, files["json"])
+
+            writers = [_create_writer(fmt, doc, files[fmt]) for fmt in formats if fmt != "json"]
+            if writers:
+                # 所有格式的默认 layers 相同；只要有一个格式需要分页就生成分页节点，
+                # 不需要分页的写入器会跳过它们
+                layers = writers[0].serializer.params.layers
+                add_page_breaks = any(writer.page_break for writer in writers)
+                for node in _iterate_items(doc=doc, layers=layers, add_page_breaks=add_page_breaks):
+                    is_page_break = isinstance(node, _PageBreakNode)
+                    for writer in writers:
+                        writer.feed(node, is_page_break)
+                for writer in writers:
+                    writer.close()
+        finally:
+            for f in files.values():
+                f.close()
+
+        for fmt in formats:
+            os.replace(tmp_paths[fmt], paths[fmt])
+    finally:
+        # 任何一步失败（包括打开文件和序列化）都不留下临时文件
+        for tmp_path in tmp_paths.values():
+            if tmp_path.exists():
+                tmp_path.unlink()
+    return paths
@@ -0,0 +1,282 @@
+import logging
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+from pydantic import PrivateAttr
+
+from docling.datamodel.base_models import ConversionStatus
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
+from docling_core.types.doc import ImageRef, Size
+
+_log = logging.getLogger(__name__)
+
+# 当前进程中仍在使用的缓存，release_page_images() 按文档哈希在其中删除图片
+_stores = weakref.WeakSet()
+
+
+class PageImageStore:
+    """页面图片的落盘缓存，内存中只保留不超过 ram_budget_bytes 的最近使用的图片
+
+    每张图片以原始像素（与 PIL tobytes() 相同的布局）写入 cache_dir 下的单独文件，
+    被淘汰后按需通过 numpy memmap 重新载入，不需要 PNG 编解码。
+    cache_dir 为 None 时使用临时目录，并在进程退出时删除。
+    """
+    def __init__(self, cache_dir=None, ram_budget_bytes=256 << 20):
+        if cache_dir is None:
+            cache_dir = tempfile.mkdtemp(prefix="docling-pages-")
+            self._finalizer = weakref.finalize(self, shutil.rmtree, cache_dir, True)
+        else:
+            self._finalizer = None
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ram_budget_bytes = ram_budget_bytes
+        self._meta = {}  # key -> (文件路径, mode, size)
+        self._ram = OrderedDict()  # key -> (图片, 字节数)，按最近使用排序
+        self._ram_bytes = 0
+        self._lock = threading.Lock()
+        self.spills = 0
+        self.loads = 0
+        _stores.add(self)
+
+    # 文档复制（如 save_as_markdown 内部的 deepcopy）时共享同一个缓存
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _path(self, key):
+        return self.cache_dir / ("_".join(str(part) for part in key).replace("/", "_") + ".raw")
+
+    def _remember(self, key, image, nbytes):
+        """放入内存 LRU，超出预算时淘汰最久未使用的图片（调用方持有锁）"""
+        if key in self._ram:
+            self._ram_bytes -= self._ram.pop(key)[1]
+        self._ram[key] = (image, nbytes)
+        self._ram_bytes += nbytes
+        while self._ram_bytes > self.ram_budget_bytes and len(self._ram) > 1:
+            _, (_, evicted_bytes) = self._ram.popitem(last=False)
+            self._ram_bytes -= evicted_bytes
+
+    def put(self, key, image):
+        """保存图片：写入磁盘并放入内存缓存"""
+        path = self._path(key)
+        data = image.tobytes()
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._meta[key] = (path, image.mode, image.size)
+            self._remember(key, image, len(data))
+            self.spills += 1
+
+    def get(self, key):
+        """读取图片，不在内存中时从磁盘载入；key 不存在时返回 None"""
+        with self._lock:
+            if key in self._ram:
+                self._ram.move_to_end(key)
+                return self._ram[key][0]
+            meta = self._meta.get(key)
+        if meta is None:
+            return None
+
+        path, mode, size = meta
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        image = Image.frombuffer(mode, size, data, "raw", mode, 0, 1).copy()
+        del data
+        with self._lock:
+            self._remember(key, image, path.stat().st_size)
+            self.loads += 1
+        return image
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._meta
+
+    def image_size(self, key):
+        """返回图片的 (宽, 高)"""
+        with self._lock:
+            return self._meta[key][2]
+
+    def discard(self, key):
+        """删除一张图片及其磁盘文件"""
+        with self._lock:
+            meta = self._meta.pop(key, None)
+            if key in self._ram:
+                self._ram_bytes -= self._ram.pop(key)[1]
+        if meta is not None:
+            meta[0].unlink(missing_ok=True)
+
+    def discard_prefix(self, prefix):
+        """删除 key 以 prefix 开头的所有图片，例如某个文档的全部页面"""
+        with self._lock:
+            keys = [key for key in self._meta if key[:len(prefix)] == prefix]
+        for key in keys:
+            self.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                images=len(self._meta),
+                ram_images=len(self._ram),
+                ram_bytes=self._ram_bytes,
+                spills=self.spills,
+                loads=self.loads,
+            )
+
+    def close(self):
+        """清空缓存并删除临时目录"""
+        with self._lock:
+            self._meta.clear()
+            self._ram.clear()
+            self._ram_bytes = 0
+        if self._finalizer is not None:
+            self._finalizer()
+
+
+class PageImageCache(MutableMapping):
+    """替代 docling Page._image_cache 的映射（缩放比例 -> 图片），图片存放在 PageImageStore 中"""
+    def __init__(self, store, prefix):
+        self.store = store
+        self.prefix = prefix
+        self._scales = set()
+
+    def __getitem__(self, scale):
+        image = self.store.get(self.prefix + (scale,))
+        if image is None:
+            raise KeyError(scale)
+        return image
+
+    def __setitem__(self, scale, image):
+        self.store.put(self.prefix + (scale,), image)
+        self._scales.add(scale)
+
+    def __contains__(self, scale):
+        # 不能沿用 Mapping 的默认实现，那样会为了判断是否存在而从磁盘载入图片
+        return scale in self._scales
+
+    def __delitem__(self, scale):
+        self.store.discard(self.prefix + (scale,))
+        self._scales.discard(scale)
+
+    def __iter__(self):
+        return iter(list(self._scales))
+
+    def __len__(self):
+        return len(self._scales)
+
+
+class StoredImageRef(ImageRef):
+    """图片数据保存在 PageImageStore 中的 ImageRef，pil_image 每次按需从缓存读取
+
+    uri 指向缓存中的原始像素文件（不是可以直接打开的图片，mimetype 相应为
+    application/octet-stream），缓存释放或进程退出后即失效。导出 JSON、
+    export_to_dict() 或把文档交给其它进程之前，先调用 embed_page_images()
+    把页面图片转换为内嵌的 PNG。
+    """
+    _store: Optional[PageImageStore] = PrivateAttr(default=None)
+    _key: Optional[tuple] = PrivateAttr(default=None)
+
+    @classmethod
+    def from_store(cls, store, key, dpi):
+        width, height = store.image_size(key)
+        ref = cls(mimetype="application/octet-stream", dpi=dpi, size=Size(width=width, height=height),
+                  uri=store._path(key))
+        ref._store = store
+        ref._key = key
+        return ref
+
+    @property
+    def pil_image(self):
+        if self._pil is None and self._store is not None:
+            return self._store.get(self._key)
+        return super().pil_image
+
+
+class SpillingPdfPipelineOptions(PdfPipelineOptions):
+    """带页面图片落盘缓存的流水线配置"""
+    page_cache_dir: Optional[str] = None  # None 表示使用进程级临时目录
+    page_ram_budget_mb: int = 256  # 内存中保留的页面图片总大小上限
+
+
+class SpillingPdfPipeline(StandardPdfPipeline):
+    """页面图片不常驻内存的标准 PDF 流水线
+
+    每页渲染的图片写入 PageImageStore，内存中只保留预算内最近使用的页面，
+    图片裁剪和导出时按需重新载入。输出文档中的页面图片为 StoredImageRef，
+    不再额外编码为 PNG data URI。处理完文档后以文档哈希（conv_res.input.document_hash）
+    调用 release_page_images() 删除缓存文件；转换失败时缓存文件在这里直接删除。
+    """
+    def __init__(self, pipeline_options: SpillingPdfPipelineOptions):
+        super().__init__(pipeline_options)  # keep_images 按原始配置计算，页面图片照常保留
+        # 页面图片由 _assemble_document 直接引用缓存，父类只读 self.pipeline_options，
+        # 给它一份关闭 generate_page_images 的副本，不修改调用方（以及转换器注册表）共享的配置
+        self.generate_page_images = pipeline_options.generate_page_images
+        self.pipeline_options = pipeline_options.model_copy(update=dict(generate_page_images=False))
+        self.page_store = PageImageStore(
+            pipeline_options.page_cache_dir,
+            ram_budget_bytes=pipeline_options.page_ram_budget_mb << 20,
+        )
+
+    def execute(self, in_doc, raises_on_error):
+        try:
+            conv_res = super().execute(in_doc, raises_on_error)
+        except BaseException:
+            self.page_store.discard_prefix((in_doc.document_hash,))
+            raise
+        if conv_res.status not in (ConversionStatus.SUCCESS, ConversionStatus.PARTIAL_SUCCESS):
+            # 调用方拿不到失败的结果，不会再释放这个文档的页面图片
+            self.page_store.discard_prefix((in_doc.document_hash,))
+        return conv_res
+
+    def initialize_page(self, conv_res, page):
+        page._image_cache = PageImageCache(self.page_store, (conv_res.input.document_hash, page.page_no))
+        return super().initialize_page(conv_res, page)
+
+    def _assemble_document(self, conv_res):
+        # 父类看到的 generate_page_images 为 False，不会把每页编码为 PNG data URI
+        conv_res = super()._assemble_document(conv_res)
+
+        if self.generate_page_images:
+            scale = self.pipeline_options.images_scale
+            for page in conv_res.pages:
+                key = (conv_res.input.document_hash, page.page_no, scale)
+                if key in self.page_store:
+                    conv_res.document.pages[page.page_no + 1].image = StoredImageRef.from_store(
+                        self.page_store, key, dpi=int(72 * scale)
+                    )
+        _log.debug(f"页面图片缓存: {self.page_store.stats()}")
+        return conv_res
+
+
+def embed_page_images(doc):
+    """把文档中保存在缓存里的页面图片转换为内嵌 PNG 的 ImageRef，返回转换的页数
+
+    只在需要导出页面图片时调用：会为每页编码 PNG 并常驻内存。
+    """
+    count = 0
+    for page in doc.pages.values():
+        if isinstance(page.image, StoredImageRef):
+            image = page.image.pil_image
+            page.image = ImageRef.from_pil(image, dpi=page.image.dpi) if image is not None else None
+            count += 1
+    return count
+
+
+def release_page_images(document_hash):
+    """删除当前进程所有缓存中属于该文档（conv_res.input.document_hash）的页面图片
+
+    不依赖文档中还留有哪些页面图片：embed_page_images() 之后，或者没有保留页面图片
+    （generate_page_images 为 False）时，缓存中的文件同样会被删除。
+    之后该文档的 StoredImageRef 不再可用。
+    """
+    for store in list(_stores):
+        store.discard_prefix((document_hash,))
@@ -0,0 +1,132 @@
+import copy
+import logging
+import math
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+_log = logging.getLogger(__name__)
+
+# 文档中按下标引用的条目列表，引用形如 "#/texts/12"
+_ITEM_LISTS = ("groups", "texts", "pictures", "tables", "key_value_items", "form_items")
+_REF_RE = re.compile(r"^#/(\w+)/(\d+)$")
+
+
+def page_count(source):
+    """返回 PDF 的页数"""
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(str(source))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def page_windows(num_pages, window_size):
+    """把 1..num_pages 切分为长度不超过 window_size 的页码区间（闭区间）"""
+    return [
+        (start, min(start + window_size - 1, num_pages))
+        for start in range(1, num_pages + 1, window_size)
+    ]
+
+
+def _shift_refs(node, offsets):
+    """递归地把 node 中的条目引用按 offsets 平移，body/furniture 等非列表引用保持不变"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in ("$ref", "self_ref") and isinstance(value, str):
+                m = _REF_RE.match(value)
+                if m and m.group(1) in offsets:
+                    node[key] = f"#/{m.group(1)}/{int(m.group(2)) + offsets[m.group(1)]}"
+            else:
+                _shift_refs(value, offsets)
+    elif isinstance(node, list):
+        for value in node:
+            _shift_refs(value, offsets)
+
+
+def merge_documents(parts):
+    """把按页码区间顺序转换得到的文档合并为一个 DoclingDocument
+
+    parts 为 export_to_dict() 的结果（或 DoclingDocument），必须按页码顺序排列。
+    docling 按页码区间转换时保留原始页码，因此只需把后续部分的条目引用按已合并
+    条目的数量平移，再把各部分正文和页眉页脚的子节点依次追加，阅读顺序即为页码顺序。
+    跨越区间边界的列表会被拆成两个相邻的列表。
+    """
+    from docling_core.types.doc import DoclingDocument
+
+    parts = [p.export_to_dict() if isinstance(p, DoclingDocument) else p for p in parts]
+    merged = copy.deepcopy(parts[0])
+    for key in _ITEM_LISTS:
+        merged.setdefault(key, [])
+    merged.setdefault("pages", {})
+
+    for part in parts[1:]:
+        part = copy.deepcopy(part)
+        offsets = {key: len(merged[key]) for key in _ITEM_LISTS}
+        _shift_refs(part, offsets)
+        for key in _ITEM_LISTS:
+            merged[key].extend(part.get(key, []))
+        for root in ("body", "furniture"):
+            if root in part and root in merged:
+                merged[root].setdefault("children", []).extend(part[root].get("children", []))
+        merged["pages"].update(part.get("pages", {}))
+
+    return DoclingDocument.model_validate(merged)
+
+
+def _convert_window(source, page_range, pipeline_options, pipeline_cls, backend):
+    """在工作进程中转换一个页码区间，返回可序列化的文档字典"""
+    from converter_registry import get_converter
+    from page_image_store import SpillingPdfPipeline, embed_page_images, release_page_images
+
+    # 注册表是进程级的，同一工作进程处理后续区间时复用已加载的模型
+    converter = get_converter(pipeline_options, pipeline_cls=pipeline_cls, backend=backend)
+    conv_res = converter.convert(source, page_range=page_range)
+    _log.info(f"已转换第 {page_range[0]}-{page_range[1]} 页")
+    if pipeline_cls is None or not issubclass(pipeline_cls, SpillingPdfPipeline):
+        return conv_res.document.export_to_dict()
+
+    # 页面图片在工作进程的缓存中，返回前转换为内嵌图片；工作进程退出时不会清理临时目录，
+    # 导出后立即删除本区间的缓存文件
+    try:
+        embed_page_images(conv_res.document)
+        return conv_res.document.export_to_dict()
+    finally:
+        release_page_images(conv_res.input.document_hash)
+
+
+def convert_parallel(source, pipeline_options, pipeline_cls=None, backend=None,
+                     workers=4, window_size=None, min_window_size=4):
+    """把 PDF 按页码区间拆分，在多个进程中并行转换后合并为一个 DoclingDocument
+
+    window_size 为 None 时按 workers 平均切分，但每个区间至少 min_window_size 页，
+    避免小文档的拆分开销超过收益；只有一个区间时直接在当前进程中转换。
+    每个工作进程都会加载一份模型，内存占用随 workers 增加；模型推理本身也是多线程的，
+    可通过 pipeline_options.accelerator_options.num_threads 控制每个进程使用的线程数。
+    source 不是本地文件（如 URL 或 DocumentStream）时无法预先读取页数，直接在当前进程中转换。
+    """
+    is_local_file = isinstance(source, (str, Path)) and Path(source).is_file()
+    windows = []
+    if is_local_file and workers > 1:
+        num_pages = page_count(source)
+        if window_size is None:
+            window_size = max(min_window_size, math.ceil(num_pages / workers))
+        windows = page_windows(num_pages, window_size)
+
+    if len(windows) <= 1:
+        from converter_registry import get_converter
+
+        converter = get_converter(pipeline_options, pipeline_cls=pipeline_cls, backend=backend)
+        return converter.convert(source).document
+
+    _log.info(f"{source} 共 {num_pages} 页，拆分为 {len(windows)} 个区间并行转换")
+    with ProcessPoolExecutor(max_workers=min(workers, len(windows))) as executor:
+        futures = [
+            executor.submit(_convert_window, str(source), window, pipeline_options, pipeline_cls, backend)
+            for window in windows
+        ]
+        # 按页码顺序收集结果，任一区间失败时抛出异常
+        parts = [future.result() for future in futures]
+    return merge_documents(parts)
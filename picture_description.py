@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from docling.datamodel.pipeline_options import PictureDescriptionApiOptions
+from docling.models.picture_description_api_model import PictureDescriptionApiModel
+from docling.pipeline.standard_pdf_pipeline import StandardPdfPipeline
+from docling.utils.api_image_request import api_image_request
+
+from page_image_store import SpillingPdfPipeline
+from response_cache import DiskCache, digest
+
+_log = logging.getLogger(__name__)
+
+
+class CachedPictureDescriptionApiOptions(PictureDescriptionApiOptions):
+    """带描述缓存的图片描述 API 配置
+
+    concurrency 为同时发出的描述请求数；cache_dir 为 None 时不缓存。
+    """
+    concurrency: int = 4
+    cache_dir: Optional[str] = "./output/.picture_description_cache"
+    cache_max_bytes: int = 256 << 20
+
+
+class CachedPictureDescriptionApiModel(PictureDescriptionApiModel):
+    """并发请求、按图片内容缓存结果的图片描述模型
+
+    缓存键由图片像素哈希、prompt 和请求参数（包括模型名）决定，与 API 地址无关；
+    同一批次中内容相同的图片只请求一次。每个请求成功后立即写入缓存，
+    中途失败时已完成的描述不会丢失，重新转换时不再请求。
+    """
+    def __init__(self, enabled, enable_remote_services, artifacts_path, options, accelerator_options):
+        super().__init__(
+            enabled=enabled,
+            enable_remote_services=enable_remote_services,
+            artifacts_path=artifacts_path,
+            options=options,
+            accelerator_options=accelerator_options,
+        )
+        self.options: CachedPictureDescriptionApiOptions
+        self.cache = None
+        if self.enabled and self.options.cache_dir:
+            self.cache = DiskCache(self.options.cache_dir, max_bytes=self.options.cache_max_bytes)
+        # 流水线按批次调用模型，批次之间是串行的；批次不小于并发数的两倍，避免并发被批次截断
+        self.elements_batch_size = max(self.elements_batch_size, 2 * self.concurrency)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.requests = 0
+
+    def _cache_key(self, image):
+        image_hash = hashlib.sha256(image.tobytes()).hexdigest()
+        return digest(dict(
+            image=image_hash,
+            mode=image.mode,
+            size=image.size,
+            prompt=self.options.prompt,
+            params=self.options.params,
+        ))
+
+    def _describe(self, key, image):
+        """请求描述并写入缓存"""
+        text = api_image_request(
+            image=image,
+            prompt=self.options.prompt,
+            url=self.options.url,
+            timeout=self.options.timeout,
+            headers=self.options.headers,
+            **self.options.params,
+        )
+        with self._stats_lock:
+            self.requests += 1
+        if self.cache is not None:
+            self.cache.put(key, dict(text=text))
+        return text
+
+    def _annotate_images(self, images):
+        images = list(images)
+        keys = [self._cache_key(image) for image in images]
+
+        results = {}
+        pending = {}
+        for key, image in zip(keys, images):
+            if key in results or key in pending:
+                continue
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                results[key] = cached["text"]
+            else:
+                pending[key] = image
+        with self._stats_lock:
+            self.hits += len(results)
+        if results:
+            _log.info(f"图片描述缓存命中 {len(results)} 张，需要请求 {len(pending)} 张")
+
+        if not pending:
+            for key in keys:
+                yield results[key]
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {key: executor.submit(self._describe, key, image) for key, image in pending.items()}
+            # 按输入顺序返回，与父类 executor.map 的行为一致
+            for key in keys:
+                if key not in results:
+                    results[key] = futures[key].result()
+                yield results[key]
+
+
+class PictureDescriptionPdfPipeline(StandardPdfPipeline):
+    """picture_description_options 为 CachedPictureDescriptionApiOptions 时使用带缓存的描述模型
+
+    其它配置与 StandardPdfPipeline 完全相同。每个文档处理完后记录缓存命中数和请求数。
+    """
+    def get_picture_description_model(self, artifacts_path=None):
+        options = self.pipeline_options.picture_description_options
+        if isinstance(options, CachedPictureDescriptionApiOptions):
+            self.cached_description_model = CachedPictureDescriptionApiModel(
+                enabled=self.pipeline_options.do_picture_description,
+                enable_remote_services=self.pipeline_options.enable_remote_services,
+                artifacts_path=artifacts_path,
+                options=options,
+                accelerator_options=self.pipeline_options.accelerator_options,
+            )
+            return self.cached_description_model
+        self.cached_description_model = None
+        return super().get_picture_description_model(artifacts_path=artifacts_path)
+
+    def _enrich_document(self, conv_res):
+        model = self.cached_description_model
+        if model is None or not model.enabled:
+            return super()._enrich_document(conv_res)
+
+        # 模型随转换器复用，计数是累计值，按差值得到本文档的数量
+        hits, requests = model.hits, model.requests
+        try:
+            return super()._enrich_document(conv_res)
+        finally:
+            _log.info(
+                f"{conv_res.input.file.name} 图片描述: 缓存命中 {model.hits - hits} 张，"
+                f"请求 {model.requests - requests} 次（累计命中 {model.hits}，请求 {model.requests}）"
+            )
+
+
+class SpillingPictureDescriptionPdfPipeline(SpillingPdfPipeline, PictureDescriptionPdfPipeline):
+    """页面图片落盘缓存（SpillingPdfPipelineOptions）与带缓存的图片描述同时启用的流水线"""
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+_log = logging.getLogger(__name__)
+
+
+def digest(payload) -> str:
+    """对可 JSON 序列化的内容计算稳定的 sha256 摘要"""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """按内容摘要寻址的磁盘缓存，超过容量时按最近访问时间淘汰
+
+    每个条目保存为 <cache_dir>/<key[:2]>/<key>.json，命中时更新文件的修改时间，
+    淘汰时从最久未访问的条目开始删除，直到总大小回到 max_bytes 以内。
+    """
+    def __init__(self, cache_dir, max_bytes: int = 1 << 30):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._total_bytes = sum(p.stat().st_size for p in self._entries())
+
+    def _entries(self):
+        return self.cache_dir.glob("*/*.json")
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        """读取缓存条目，未命中返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # 记录最近访问时间，供 LRU 淘汰使用
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            _log.warning(f"读取缓存条目 {key[:12]} 失败: {e}")
+            return None
+
+    def put(self, key: str, value):
+        """写入缓存条目，必要时淘汰旧条目"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+        # 先写临时文件再原子替换，避免中断时留下半个条目
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """按修改时间从旧到新删除条目，直到总大小不超过上限"""
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                self._total_bytes -= size
+            except FileNotFoundError:
+                pass
+        _log.info(f"缓存淘汰完成，当前大小: {self._total_bytes} 字节")
@@ -0,0 +1,184 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+
+class _Frame:
+    """正在执行的阶段"""
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.child_peak = 0  # 子阶段的内存峰值，子阶段会重置 tracemalloc 的峰值
+
+
+def max_rss_mb():
+    """进程至今的峰值常驻内存（MB），无法获取时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+class StageProfiler:
+    """按阶段记录耗时、CPU 时间和内存峰值，可导出为 Chrome trace
+
+    每个阶段用 span() 包裹，可以嵌套，也可以在线程池中使用（按线程分别记录）。
+    trace_memory 为 True 时用 tracemalloc 统计 Python 对象的内存峰值，只对创建
+    profiler 的线程生效；模型推理等原生内存不在统计范围内，可参考 max_rss_mb
+    （进程至今的峰值常驻内存）。
+    enabled 为 False 时所有方法都是空操作，不影响正常处理的性能。
+    """
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owner = threading.get_ident()
+        self._thread_names = {}
+        # perf_counter 与 Unix 时间的差值，所有事件使用同一时间轴
+        self._epoch_offset = time.time() - time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name, category="stage", **args):
+        """记录一个阶段，返回上下文管理器"""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._span(name, category, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, category, args):
+        tid = threading.get_ident()
+        track_memory = self.trace_memory and tid == self._owner
+        stack = self._stack()
+        frame = _Frame(name, category, args)
+        if track_memory:
+            # 进入子阶段前先把父阶段到目前为止的峰值记下来
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        stack.append(frame)
+
+        # 主线程的阶段用进程 CPU 时间，包括模型推理的线程池；线程池中的阶段只统计本线程
+        cpu_clock = time.process_time if tid == self._owner else time.thread_time
+        start = time.perf_counter()
+        cpu_start = cpu_clock()
+        try:
+            yield frame
+        finally:
+            wall = time.perf_counter() - start
+            cpu = cpu_clock() - cpu_start
+            stack.pop()
+
+            event_args = dict(frame.args, cpu_ms=round(cpu * 1000, 3))
+            if track_memory:
+                peak = max(frame.child_peak, tracemalloc.get_traced_memory()[1])
+                event_args["peak_mem_mb"] = round((peak - start_memory) / (1 << 20), 3)
+                rss = max_rss_mb()
+                if rss is not None:
+                    event_args["max_rss_mb"] = round(rss, 1)
+                if stack:
+                    stack[-1].child_peak = max(stack[-1].child_peak, peak)
+                tracemalloc.reset_peak()
+            self._add(frame.name, frame.category, start + self._epoch_offset, wall, tid, event_args)
+
+    def _add(self, name, category, start, duration, tid, args):
+        with self._lock:
+            if tid not in self._thread_names:
+                self._thread_names[tid] = (
+                    threading.current_thread().name if isinstance(tid, int) else str(tid)
+                )
+            self.events.append(dict(name=name, cat=category, start=start, dur=duration, tid=tid, args=args))
+
+    def add_event(self, name, start, duration, category="stage", tid="docling", **args):
+        """添加外部测得的事件，start 为 Unix 时间戳（秒）"""
+        if self.enabled:
+            self._add(name, category, start, duration, tid, args)
+
+    def add_docling_timings(self, timings):
+        """导入 docling 的流水线计时（ConversionResult.timings）
+
+        需要在转换前设置 settings.debug.profile_pipeline_timings = True。
+        页面级的计时按批次记录，每个事件对应一次批处理调用。
+        """
+        if not self.enabled:
+            return
+        for key, item in timings.items():
+            scope = getattr(item.scope, "value", item.scope)
+            for index, (started, duration) in enumerate(zip(item.start_timestamps, item.times)):
+                # docling 使用 datetime.utcnow() 记录开始时间，没有时区信息
+                start = started.replace(tzinfo=timezone.utc).timestamp()
+                self.add_event(key, start, duration, category=f"docling.{scope}", index=index)
+
+    def summary(self):
+        """按阶段名汇总：次数、总耗时、总 CPU 时间和最大内存峰值"""
+        totals = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            total = totals.setdefault(event["name"], dict(count=0, wall_s=0.0, cpu_s=0.0, peak_mem_mb=None))
+            total["count"] += 1
+            total["wall_s"] += event["dur"]
+            total["cpu_s"] += event["args"].get("cpu_ms", 0) / 1000
+            peak = event["args"].get("peak_mem_mb")
+            if peak is not None:
+                total["peak_mem_mb"] = max(total["peak_mem_mb"] or 0, peak)
+        return totals
+
+    def to_chrome_trace(self):
+        """转换为 Chrome trace 格式（chrome://tracing 或 Perfetto 可直接打开）"""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self._thread_names)
+
+        # Chrome trace 的 tid 必须是整数，非整数的轨道（如 docling）按出现顺序编号
+        tids = {}
+        for tid in thread_names:
+            tids[tid] = tid if isinstance(tid, int) else len(tids) + 1
+
+        trace_events = [
+            dict(name="thread_name", ph="M", pid=pid, tid=tids[tid], args=dict(name=name))
+            for tid, name in thread_names.items()
+        ]
+        for event in sorted(events, key=lambda e: e["start"]):
+            trace_events.append(dict(
+                name=event["name"],
+                cat=event["cat"],
+                ph="X",
+                ts=event["start"] * 1e6,
+                dur=event["dur"] * 1e6,
+                pid=pid,
+                tid=tids[event["tid"]],
+                args=event["args"],
+            ))
+        return dict(traceEvents=trace_events, displayTimeUnit="ms")
+
+    def save_chrome_trace(self, path):
+        """保存 Chrome trace JSON，返回文件路径"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return path
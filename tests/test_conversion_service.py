@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("docling")
+
+from docling_core.types.doc import DoclingDocument, Size
+from PIL import Image
+
+import main_custom_oss_serializer
+from conversion_service import DONE, ConversionJob, ConversionService
+from page_image_store import PageImageStore, SpillingPdfPipelineOptions, StoredImageRef
+
+
+class FakeConverter:
+    """按 SpillingPdfPipeline 的方式把页面图片放入落盘缓存，不加载模型"""
+    def __init__(self, page_store):
+        self.page_store = page_store
+
+    def convert(self, source):
+        document_hash = "fake-document-hash"
+        doc = DoclingDocument(name="fake")
+        for page_no in (1, 2):
+            doc.add_page(page_no=page_no, size=Size(width=40, height=30))
+            key = (document_hash, page_no - 1, 1.0)
+            self.page_store.put(key, Image.new("RGB", (40, 30), (page_no, 0, 0)))
+            doc.pages[page_no].image = StoredImageRef.from_store(self.page_store, key, dpi=72)
+        return SimpleNamespace(
+            input=SimpleNamespace(document_hash=document_hash),
+            document=doc,
+            timings={},
+        )
+
+
+@pytest.mark.parametrize("result_format", ["json", "markdown"])
+def test_job_releases_spilled_page_images(tmp_path, monkeypatch, result_format):
+    page_store = PageImageStore(tmp_path / "pages")
+    monkeypatch.setattr(main_custom_oss_serializer, "get_converter",
+                        lambda *args, **kwargs: FakeConverter(page_store))
+
+    service = ConversionService(warm_up=False, upload_dir=tmp_path / "uploads")
+    monkeypatch.setattr(service.processor, "setup_pipeline_options",
+                        lambda: SpillingPdfPipelineOptions(generate_page_images=True))
+
+    job = ConversionJob("test", str(tmp_path / "fake.pdf"), result_format=result_format)
+    service._run_job(job)
+
+    assert job.status == DONE, job.error
+    if result_format == "json":
+        assert job.result["pages"]["1"]["image"]["mimetype"] == "image/png"
+    assert page_store.stats()["images"] == 0
@@ -0,0 +1,210 @@
+import logging
+import random
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态码：超时、冲突、限流和服务端临时错误
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _status_code(error):
+    """从 liteLLM/HTTP 异常中取出状态码"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_throttled(error) -> bool:
+    """上游是否因配额限流而拒绝请求"""
+    return _status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error) -> bool:
+    """判断错误是否为临时错误，可以退避后重试"""
+    if is_throttled(error):
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶
+
+    charge() 允许余额为负，用于按实际用量（如响应中的 token 数）事后扣减，
+    之后的 acquire() 会等到欠额补齐后再放行。
+    per_minute 至少为 1，否则桶容量不足一个令牌，acquire(1) 永远无法返回。
+    """
+    def __init__(self, per_minute: float):
+        if per_minute < 1:
+            raise ValueError(f"每分钟配额必须至少为 1: {per_minute}")
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1):
+        """阻塞直到桶中有 amount 个令牌并扣除；amount 为 0 时只等待欠额补齐"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+            time.sleep(max(wait, 0.01))
+
+    def charge(self, amount: float):
+        """事后扣除令牌，余额可以为负"""
+        with self._lock:
+            self._refill()
+            self.level -= amount
+
+
+class AdaptiveLimiter:
+    """AIMD 并发限制器：成功时加性增加并发上限，被限流时乘性减半"""
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, success: bool, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_limit, self.limit / 2)
+            elif success:
+                # 每个完整窗口（约 limit 次成功）上限加 1
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class UpstreamScheduler:
+    """上游 VLM 调用调度器：配额限速、退避重试和自适应并发
+
+    requests_per_minute / tokens_per_minute 为 None 时不限制对应配额。
+    可重试错误按带抖动的指数退避重试，最多 max_retries 次。
+    slots 为可选的信号量（如全局上游并发上限），与并发限制器一样按每次尝试占用，
+    退避等待期间不占用任何名额。
+    """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None,
+                 max_concurrency: int = 8, min_concurrency: int = 1,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 slots=None):
+        self.slots = slots
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.limiter = AdaptiveLimiter(max_concurrency, min_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（等量抖动的指数退避）"""
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _acquire(self):
+        self.limiter.acquire()
+        try:
+            if self.slots is not None:
+                self.slots.acquire()
+            try:
+                if self.request_bucket:
+                    self.request_bucket.acquire(1)
+                if self.token_bucket:
+                    self.token_bucket.acquire(0)  # 等待之前的 token 用量欠额补齐
+            except BaseException:
+                if self.slots is not None:
+                    self.slots.release()
+                raise
+        except BaseException:
+            self.limiter.release(success=False)
+            raise
+
+    def _release(self, success: bool, throttled: bool = False):
+        if self.slots is not None:
+            self.slots.release()
+        self.limiter.release(success=success, throttled=throttled)
+        if throttled:
+            with self._lock:
+                self.throttled += 1
+
+    def _call(self, fn):
+        """调用 fn，可重试错误退避后重试；成功返回时仍占用本次尝试的名额"""
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                return fn()
+            except Exception as e:
+                self._release(success=False, throttled=is_throttled(e))
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                _log.warning(f"上游调用失败（{e}），{delay:.1f} 秒后第 {attempt} 次重试")
+                time.sleep(delay)
+
+    def run(self, fn):
+        """在配额和并发限制下调用 fn，可重试错误退避后重试"""
+        result = self._call(fn)
+        self._release(success=True)
+        return result
+
+    def stream(self, fn):
+        """fn 返回一个流（可迭代对象），逐项产出流中的内容
+
+        只有建立流时的错误会退避重试；名额一直占用到流被完整读取、出错或被关闭，
+        长时间的流也计入并发。
+        """
+        response = self._call(fn)
+        success = False
+        throttled = False
+        try:
+            for item in response:
+                yield item
+            success = True
+        except Exception as e:
+            throttled = is_throttled(e)
+            raise
+        finally:
+            self._release(success=success, throttled=throttled)
+
+    def record_usage(self, total_tokens):
+        """按响应中的实际 token 用量扣减 token 配额"""
+        if self.token_bucket and total_tokens:
+            self.token_bucket.charge(total_tokens)
+
+    def snapshot(self):
+        """返回调度器状态，用于 /metrics"""
+        with self._lock:
+            return {
+                "concurrency_limit": self.limiter.limit,
+                "in_flight": self.limiter.in_flight,
+                "retries": self.retries,
+                "throttled": self.throttled,
+            }